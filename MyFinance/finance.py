@@ -1,10 +1,13 @@
 import asyncio
 
+from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from core.engine import get_async_session
+from sqlalchemy.orm import sessionmaker
+from config import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from core.engine import get_async_session, get_read_session, get_read_session_maker, run_in_session
 from core import repository_entity
-from fastapi import APIRouter, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, Header, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from MyFinance import schemas, services
 from typing import Union, List
 from users.models import User
@@ -14,52 +17,268 @@ from users.utils import current_user
 router = APIRouter()
 
 
+async def data_etag(
+        response: Response,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_read_session),
+        if_none_match: Union[str, None] = Header(None)
+) -> str:
+    """ ETag by user data version, 304 without running the read if it is not modified.
+        The version is read in the endpoint read session before the data, so a lagging replica
+        can only give an older ETag than the data, never a newer one
+    """
+    version = await repository_entity.DataVersionEntity(session).get_version(user.id)
+    etag = services.make_etag(user.id, version)
+    services.check_not_modified(if_none_match, etag)
+    response.headers.update(services.etag_headers(etag))
+    return etag
+
+
 @router.get("/", response_model=schemas.MainSchema)
 async def main(
         user: User = Depends(current_user),
-        session: AsyncSession = Depends(get_async_session),
+        session_maker: sessionmaker = Depends(get_read_session_maker),
+        etag: str = Depends(data_etag),
         start_date_str: Union[str, None] = None,
-        end_date_str: Union[str, None] = None
+        end_date_str: Union[str, None] = None,
+        currency: Union[schemas.CurrencyCode, None] = None
 ) -> schemas.MainSchema:
-    """ Main endpoint
+    """ Main endpoint, with currency the balances and totals are converted into it
     """
-    account_sum_db_result, income, expense = await asyncio.gather(
-        repository_entity.AccountEntity(session).get_account_sum(user_id=user.id),
-        get_income_list(user, session, start_date_str, end_date_str),
-        get_expense_list(user, session, start_date_str, end_date_str)
+    start_date, end_date = services.get_formatted_datetime(
+        start=start_date_str,
+        end=end_date_str
+    )
+    account_sum_db_result, income, expense, totals = await asyncio.gather(
+        run_in_session(
+            session_maker,
+            lambda session: repository_entity.AccountEntity(session).get_account_sum(
+                user_id=user.id, currency=currency
+            )
+        ),
+        run_in_session(
+            session_maker,
+            lambda session: repository_entity.IncomeEntity(session).get_income_list(user.id, start_date, end_date)
+        ),
+        run_in_session(
+            session_maker,
+            lambda session: repository_entity.ExpenseEntity(session).get_expense_list(user.id, start_date, end_date)
+        ),
+        run_in_session(
+            session_maker,
+            lambda session: repository_entity.SummaryEntity(session).get_summary(
+                user.id, start_date, end_date, group_by=[], period=schemas.SummaryPeriod.month.value,
+                currency=currency
+            )
+        )
     )
 
     account_sum = services.prepare_account_sum(account_sum_db_result=account_sum_db_result)
     return schemas.MainSchema(
         account_sum=account_sum,
         income=income,
-        expense=expense
+        expense=expense,
+        totals=totals
     )
 
 
-@router.get("/income", response_model=List[schemas.IncomeSchema])
-async def get_income_list(
+@router.get("/summary", response_model=List[schemas.SummarySchema])
+async def get_summary(
         user: User = Depends(current_user),
-        session: AsyncSession = Depends(get_async_session),
+        session: AsyncSession = Depends(get_read_session),
+        start_date_str: Union[str, None] = None,
+        end_date_str: Union[str, None] = None,
+        group_by: List[schemas.SummaryGroup] = Query([]),
+        period: Union[schemas.SummaryPeriod, None] = None,
+        currency: Union[schemas.CurrencyCode, None] = None
+) -> List[schemas.SummarySchema]:
+    """ Get income and expense totals endpoint, with currency the totals are converted into it
+    """
+    start_date, end_date = services.get_formatted_datetime(
+        start=start_date_str,
+        end=end_date_str
+    )
+    return await repository_entity.SummaryEntity(session).get_summary(
+        user.id, start_date, end_date,
+        group_by=[group.value for group in group_by],
+        period=period.value if period else None,
+        currency=currency
+    )
+
+
+@router.get("/count", response_model=schemas.CountSchema)
+async def get_count(
+        entity: schemas.EntityType,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_read_session),
+        etag: str = Depends(data_etag),
+        start_date_str: Union[str, None] = None,
+        end_date_str: Union[str, None] = None,
+        category_id: Union[int, None] = None
+) -> schemas.CountSchema:
+    """ Get number of records of one entity endpoint
+    """
+    start_date, end_date = services.get_formatted_datetime(
+        start=start_date_str,
+        end=end_date_str
+    )
+    count = await repository_entity.CountsEntity(session).get_count(
+        entity.value, user.id, start_date, end_date, category_id
+    )
+    return schemas.CountSchema(count=count)
+
+
+@router.get("/counts", response_model=schemas.CountsSchema)
+async def get_counts(
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_read_session),
+        etag: str = Depends(data_etag),
         start_date_str: Union[str, None] = None,
         end_date_str: Union[str, None] = None
-) -> List[schemas.IncomeSchema]:
+) -> schemas.CountsSchema:
+    """ Get number of records of all entities in one query endpoint
+    """
+    start_date, end_date = services.get_formatted_datetime(
+        start=start_date_str,
+        end=end_date_str
+    )
+    return await repository_entity.CountsEntity(session).get_counts(user.id, start_date, end_date)
+
+
+@router.get("/export")
+async def export_transactions(
+        user: User = Depends(current_user),
+        session_maker: sessionmaker = Depends(get_read_session_maker),
+        start_date_str: Union[str, None] = None,
+        end_date_str: Union[str, None] = None,
+        export_format: schemas.ExportFormat = Query(schemas.ExportFormat.csv, alias="format")
+) -> StreamingResponse:
+    """ Stream income and expense history as CSV or NDJSON endpoint
+    """
+    start_date, end_date = services.get_formatted_datetime(
+        start=start_date_str,
+        end=end_date_str
+    )
+
+    async def rows():
+        async with session_maker() as session:
+            async for row in repository_entity.ExportEntity(session).stream_transactions(
+                    user.id, start_date, end_date
+            ):
+                yield row
+
+    media_type = "text/csv" if export_format == schemas.ExportFormat.csv else "application/x-ndjson"
+    return StreamingResponse(
+        services.export_lines(rows(), export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions.{export_format.value}"'}
+    )
+
+
+@router.get("/transactions", response_model=schemas.TransactionPageSchema)
+async def get_transactions(
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_read_session),
+        etag: str = Depends(data_etag),
+        kind: Union[schemas.TransactionKind, None] = None,
+        category_id: Union[int, None] = None,
+        start_date_str: Union[str, None] = None,
+        end_date_str: Union[str, None] = None,
+        cursor: Union[str, None] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+) -> schemas.TransactionPageSchema:
+    """ Get income and expense feed ordered by date endpoint
+    """
+    start_date, end_date = services.get_formatted_datetime(
+        start=start_date_str,
+        end=end_date_str
+    )
+    result = await repository_entity.TransactionEntity(session).get_transactions(
+        user.id, kind.value if kind else None, start_date, end_date, category_id,
+        after=services.decode_cursor(cursor, with_kind=True), limit=limit
+    )
+    return services.prepare_page_response(result, limit, headers=services.etag_headers(etag))
+
+
+@router.get("/search", response_model=schemas.TransactionPageSchema)
+async def search(
+        q: str = Query(..., min_length=services.SEARCH_MIN_LENGTH, max_length=100),
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_read_session),
+        etag: str = Depends(data_etag),
+        kind: Union[schemas.TransactionKind, None] = None,
+        category_id: Union[int, None] = None,
+        start_date_str: Union[str, None] = None,
+        end_date_str: Union[str, None] = None,
+        cursor: Union[str, None] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+) -> schemas.TransactionPageSchema:
+    """ Search income and expense by title endpoint
+    """
+    start_date, end_date = services.get_formatted_datetime(
+        start=start_date_str,
+        end=end_date_str
+    )
+    result = await repository_entity.TransactionEntity(session).search(
+        user.id, services.prepare_search_query(q), kind.value if kind else None, start_date, end_date, category_id,
+        after=services.decode_cursor(cursor, with_kind=True), limit=limit
+    )
+    return services.prepare_page_response(result, limit, headers=services.etag_headers(etag))
+
+
+@router.get("/sync", response_model=schemas.SyncSchema)
+async def sync(
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session),
+        since: Union[datetime, None] = None
+) -> schemas.SyncSchema:
+    """ Get records changed or deleted since the previous sync watermark endpoint.
+        Reads the primary, a lagging replica could lose changes behind the watermark
+    """
+    watermark = services.get_sync_watermark()
+    changes = await repository_entity.SyncEntity(session).get_changes(user.id, services.get_sync_since(since))
+    return services.prepare_sync_response(watermark, changes)
+
+
+@router.post("/batch", response_model=List[schemas.BatchResultSchema])
+async def batch(
+        operations: List[schemas.BatchOperation],
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> List[schemas.BatchResultSchema]:
+    """ Apply create, update and delete operations in one transaction endpoint
+    """
+    services.check_batch(operations)
+    return await repository_entity.BatchEntity(session).apply(user.id, operations)
+
+
+@router.get("/income", response_model=schemas.IncomePageSchema)
+async def get_income_list(
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_read_session),
+        etag: str = Depends(data_etag),
+        start_date_str: Union[str, None] = None,
+        end_date_str: Union[str, None] = None,
+        cursor: Union[str, None] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+) -> schemas.IncomePageSchema:
     """ Get income list endpoint
     """
     start_date, end_date = services.get_formatted_datetime(
         start=start_date_str,
         end=end_date_str
     )
-    return await repository_entity.IncomeEntity(session).get_income_list(
-        user.id, start_date, end_date
+    result = await repository_entity.IncomeEntity(session).get_income_list(
+        user.id, start_date, end_date, after=services.decode_cursor(cursor), limit=limit
     )
+    return services.prepare_page_response(result, limit, headers=services.etag_headers(etag))
 
 
 @router.get("/income/{id}", response_model=Union[schemas.IncomeSchema, None])
 async def get_income_by_id(
         pk: int,
         user: User = Depends(current_user),
-        session: AsyncSession = Depends(get_async_session)
+        session: AsyncSession = Depends(get_read_session)
 ) -> Union[schemas.IncomeSchema, None]:
     """ Get income by id endpoint
     """
@@ -68,23 +287,27 @@ async def get_income_by_id(
     )
 
 
-@router.get("/income/category/{id}", response_model=List[schemas.IncomeSchema])
+@router.get("/income/category/{id}", response_model=schemas.IncomePageSchema)
 async def get_income_by_category_id(
         pk: int,
         user: User = Depends(current_user),
-        session: AsyncSession = Depends(get_async_session),
+        session: AsyncSession = Depends(get_read_session),
+        etag: str = Depends(data_etag),
         start_date_str: Union[str, None] = None,
-        end_date_str: Union[str, None] = None
-) -> List[schemas.IncomeSchema]:
+        end_date_str: Union[str, None] = None,
+        cursor: Union[str, None] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+) -> schemas.IncomePageSchema:
     """ Get income by category id endpoint
     """
     start_date, end_date = services.get_formatted_datetime(
         start=start_date_str,
         end=end_date_str
     )
-    return await repository_entity.IncomeEntity(session).get_income_list_by_category(
-        pk, user.id, start_date, end_date
+    result = await repository_entity.IncomeEntity(session).get_income_list_by_category(
+        pk, user.id, start_date, end_date, after=services.decode_cursor(cursor), limit=limit
     )
+    return services.prepare_page_response(result, limit, headers=services.etag_headers(etag))
 
 
 @router.post("/income")
@@ -104,6 +327,24 @@ async def create_income(
     )
 
 
+@router.post("/income/bulk")
+async def import_income(
+        request: Request,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> JSONResponse:
+    """ Bulk add income endpoint, accepts a JSON array or NDJSON
+    """
+    items = await services.parse_import(request)
+    result = await repository_entity.IncomeEntity(session).bulk_create(
+        items, user.id
+    )
+    return services.prepare_response(
+        result,
+        success_status_code=status.HTTP_201_CREATED
+    )
+
+
 @router.patch("/income/{id}")
 async def update_income(
         pk: int,
@@ -133,28 +374,32 @@ async def delete_income(
     return services.prepare_response(result)
 
 
-@router.get("/expense", response_model=List[schemas.ExpenseSchema])
+@router.get("/expense", response_model=schemas.ExpensePageSchema)
 async def get_expense_list(
         user: User = Depends(current_user),
-        session: AsyncSession = Depends(get_async_session),
+        session: AsyncSession = Depends(get_read_session),
+        etag: str = Depends(data_etag),
         start_date_str: Union[str, None] = None,
-        end_date_str: Union[str, None] = None
-) -> List[schemas.ExpenseSchema]:
+        end_date_str: Union[str, None] = None,
+        cursor: Union[str, None] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+) -> schemas.ExpensePageSchema:
     """ Get expense list endpoint
     """
     start_date, end_date = services.get_formatted_datetime(
         start=start_date_str,
         end=end_date_str
     )
-    return await repository_entity.ExpenseEntity(session).get_expense_list(
-        user.id, start_date, end_date
+    result = await repository_entity.ExpenseEntity(session).get_expense_list(
+        user.id, start_date, end_date, after=services.decode_cursor(cursor), limit=limit
     )
+    return services.prepare_page_response(result, limit, headers=services.etag_headers(etag))
 
 
 @router.get("/expense/{id}", response_model=Union[schemas.ExpenseSchema, None])
 async def get_expense_by_id(
         pk: int, user: User = Depends(current_user),
-        session: AsyncSession = Depends(get_async_session)
+        session: AsyncSession = Depends(get_read_session)
 ) -> Union[schemas.ExpenseSchema, None]:
     """ Get expense by id endpoint
     """
@@ -163,23 +408,27 @@ async def get_expense_by_id(
     )
 
 
-@router.get("/expense/category/{id}", response_model=List[schemas.ExpenseSchema])
+@router.get("/expense/category/{id}", response_model=schemas.ExpensePageSchema)
 async def get_expense_by_category_id(
         pk: int,
         user: User = Depends(current_user),
-        session: AsyncSession = Depends(get_async_session),
+        session: AsyncSession = Depends(get_read_session),
+        etag: str = Depends(data_etag),
         start_date_str: Union[str, None] = None,
-        end_date_str: Union[str, None] = None
-) -> List[schemas.ExpenseSchema]:
+        end_date_str: Union[str, None] = None,
+        cursor: Union[str, None] = None,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+) -> schemas.ExpensePageSchema:
     """ Get expense by category endpoint
     """
     start_date, end_date = services.get_formatted_datetime(
         start=start_date_str,
         end=end_date_str
     )
-    return await repository_entity.ExpenseEntity(session).get_expense_list_by_category(
-        pk, user.id, start_date, end_date
+    result = await repository_entity.ExpenseEntity(session).get_expense_list_by_category(
+        pk, user.id, start_date, end_date, after=services.decode_cursor(cursor), limit=limit
     )
+    return services.prepare_page_response(result, limit, headers=services.etag_headers(etag))
 
 
 @router.post("/expense")
@@ -199,6 +448,24 @@ async def create_expense(
     )
 
 
+@router.post("/expense/bulk")
+async def import_expense(
+        request: Request,
+        user: User = Depends(current_user),
+        session: AsyncSession = Depends(get_async_session)
+) -> JSONResponse:
+    """ Bulk add expense endpoint, accepts a JSON array or NDJSON
+    """
+    items = await services.parse_import(request)
+    result = await repository_entity.ExpenseEntity(session).bulk_create(
+        items, user.id
+    )
+    return services.prepare_response(
+        result,
+        success_status_code=status.HTTP_201_CREATED
+    )
+
+
 @router.patch("/expense/{id}")
 async def update_expense(
         pk: int,
@@ -241,7 +508,7 @@ async def get_category_list(
 @router.get("/category/{id}", response_model=Union[schemas.CategorySchema, None])
 async def get_category_by_id(
         pk: int, user: User = Depends(current_user),
-        session: AsyncSession = Depends(get_async_session)
+        session: AsyncSession = Depends(get_read_session)
 ) -> Union[schemas.CategorySchema, None]:
     """ Get category by id endpoint
     """
@@ -310,7 +577,7 @@ async def get_currency_list(
 async def get_currency_by_id(
         pk: int,
         user: User = Depends(current_user),
-        session: AsyncSession = Depends(get_async_session)
+        session: AsyncSession = Depends(get_read_session)
 ) -> Union[schemas.CurrencySchema, None]:
     """ Get currency by id endpoint
     """
@@ -368,18 +635,19 @@ async def delete_currency(
 @router.get("/account", response_model=List[schemas.AccountSchema])
 async def get_account_list(
         user: User = Depends(current_user),
-        session: AsyncSession = Depends(get_async_session)
+        session: AsyncSession = Depends(get_async_session),
+        etag: str = Depends(data_etag)
 ) -> List[schemas.AccountSchema]:
     """ Get account list endpoint
     """
-    return await repository_entity.AccountEntity(session).get_account_list(user.id)
+    return await repository_entity.AccountEntity(session).get_account_list(user.id, version=etag)
 
 
 @router.get("/account/{id}", response_model=Union[schemas.AccountSchema, None])
 async def get_account_by_id(
         pk: int,
         user: User = Depends(current_user),
-        session: AsyncSession = Depends(get_async_session)
+        session: AsyncSession = Depends(get_read_session)
 ) -> Union[schemas.AccountSchema, None]:
     """ Get account by id endpoint
     """
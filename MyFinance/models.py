@@ -1,6 +1,6 @@
 from core.engine import Base
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, DateTime, Float, ForeignKey, Boolean
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Numeric, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 
 
@@ -8,23 +8,32 @@ class Currency(Base):
     """ Модель валют (рубли, доллары, евро и тд)
     """
     __tablename__ = "currency"
+    __table_args__ = (
+        Index("ix_currency_user_id", "user_id"),
+        Index("ix_currency_user_id_updated_at", "user_id", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, unique=True, autoincrement=True)
     name = Column(String)
     user_id = Column(Integer, ForeignKey('user.id'))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class Account(Base):
     """ Модель счетов
     """
     __tablename__ = "account"
+    __table_args__ = (
+        Index("ix_account_user_id", "user_id"),
+        Index("ix_account_user_id_updated_at", "user_id", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, unique=True, autoincrement=True)
     name = Column(String)
     currency_id = Column(Integer, ForeignKey('currency.id'))
-    currency = relationship("Currency", lazy="joined")
-    updated_at = Column(DateTime)
-    amount = Column(Float)
+    currency = relationship("Currency", lazy="raise")
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    amount = Column(Numeric(18, 2))
     add_to_balance = Column(Boolean, default=True)
     user_id = Column(Integer, ForeignKey('user.id'))
 
@@ -33,40 +42,120 @@ class Category(Base):
     """ Модель категорий доходов и рассходов
     """
     __tablename__ = "category"
+    __table_args__ = (
+        Index("ix_category_user_id", "user_id"),
+        Index("ix_category_user_id_updated_at", "user_id", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True, unique=True, autoincrement=True)
     name = Column(String)
     category_type = Column(String)
     user_id = Column(Integer, ForeignKey('user.id'))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class Income(Base):
-    """ Модель доходов
+    """ Модель доходов. В PostgreSQL таблица секционирована по date (core.partitions),
+        первичный ключ в БД - (id, date)
     """
     __tablename__ = "income"
+    __table_args__ = (
+        Index("ix_income_user_id_date_id", "user_id", "date", "id"),
+        Index("ix_income_user_id_category_id_date", "user_id", "category_id", "date"),
+        Index("ix_income_user_id_updated_at", "user_id", "updated_at"),
+        # Триграммный индекс для поиска по названию (ILIKE и нечеткое совпадение)
+        Index("ix_income_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+    )
 
-    id = Column(Integer, primary_key=True, index=True, unique=True, autoincrement=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     title = Column(String)
     category_id = Column(Integer, ForeignKey('category.id'))
-    category = relationship("Category", lazy="joined")
-    amount = Column(Float)
+    category = relationship("Category", lazy="raise")
+    amount = Column(Numeric(18, 2))
     account_id = Column(Integer, ForeignKey('account.id'))
-    account = relationship("Account", lazy="joined")
-    date = Column(DateTime, default=datetime.utcnow())
+    account = relationship("Account", lazy="raise")
+    date = Column(DateTime, nullable=False, default=datetime.utcnow)
     user_id = Column(Integer, ForeignKey('user.id'))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
 class Expense(Base):
-    """ Модель расходов
+    """ Модель расходов. В PostgreSQL таблица секционирована по date (core.partitions),
+        первичный ключ в БД - (id, date)
     """
     __tablename__ = "expense"
+    __table_args__ = (
+        Index("ix_expense_user_id_date_id", "user_id", "date", "id"),
+        Index("ix_expense_user_id_category_id_date", "user_id", "category_id", "date"),
+        Index("ix_expense_user_id_updated_at", "user_id", "updated_at"),
+        # Триграммный индекс для поиска по названию (ILIKE и нечеткое совпадение)
+        Index("ix_expense_title_trgm", "title", postgresql_using="gin", postgresql_ops={"title": "gin_trgm_ops"}),
+    )
 
-    id = Column(Integer, primary_key=True, index=True, unique=True, autoincrement=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     title = Column(String)
     category_id = Column(Integer, ForeignKey('category.id'))
-    category = relationship("Category", lazy="joined")
-    amount = Column(Float)
+    category = relationship("Category", lazy="raise")
+    amount = Column(Numeric(18, 2))
     account_id = Column(Integer, ForeignKey('account.id'))
-    account = relationship("Account", lazy="joined")
-    date = Column(DateTime, default=datetime.utcnow())
+    account = relationship("Account", lazy="raise")
+    date = Column(DateTime, nullable=False, default=datetime.utcnow)
     user_id = Column(Integer, ForeignKey('user.id'))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class MonthlyRollup(Base):
+    """ Месячные итоги доходов и расходов пользователя.
+        Обновляются вместе с доходами / расходами, пересчитываются командой commands.rebuild_rollups
+    """
+    __tablename__ = "monthly_rollup"
+
+    user_id = Column(Integer, ForeignKey('user.id'), primary_key=True)
+    month = Column(DateTime, primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    account_id = Column(Integer, primary_key=True)
+    kind = Column(String, primary_key=True)
+    total = Column(Numeric(18, 2), nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class DataVersion(Base):
+    """ Счетчик изменений данных пользователя, используется как ETag для чтения.
+        Увеличивается в той же транзакции, что и изменение данных
+    """
+    __tablename__ = "data_version"
+
+    user_id = Column(Integer, ForeignKey('user.id'), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+
+
+class Tombstone(Base):
+    """ Удаленные доходы, расходы, счета, категории и валюты для синхронизации клиентов
+    """
+    __tablename__ = "tombstone"
+    __table_args__ = (
+        Index("ix_tombstone_user_id_deleted_at", "user_id", "deleted_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String, nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    user_id = Column(Integer, ForeignKey('user.id'))
+
+
+class ExchangeRate(Base):
+    """ Курсы валют: сколько единиц quote стоит одна единица base на дату.
+        Общие для всех пользователей, загружаются командой commands.load_exchange_rates
+    """
+    __tablename__ = "exchange_rate"
+    __table_args__ = (
+        Index("ix_exchange_rate_loaded_at", "loaded_at"),
+    )
+
+    base = Column(String, primary_key=True)
+    quote = Column(String, primary_key=True)
+    date = Column(DateTime, primary_key=True)
+    rate = Column(Numeric(18, 8), nullable=False)
+    # Время загрузки, по последнему значению процессы понимают, что кэш курсов устарел
+    loaded_at = Column(DateTime, nullable=False, default=datetime.utcnow)
@@ -1,6 +1,15 @@
-from datetime import datetime
-from pydantic import BaseModel, Field, root_validator
-from typing import List
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from enum import Enum
+from pydantic import BaseModel, condecimal, constr, root_validator, validator
+from typing import List, Union
+
+
+# Денежная сумма с точностью до копеек, как NUMERIC(18, 2) в БД
+Money = condecimal(max_digits=18, decimal_places=2)
+PositiveMoney = condecimal(gt=0, max_digits=18, decimal_places=2)
+# Код валюты, курсы сопоставляются с названием валюты без учета регистра
+CurrencyCode = constr(strip_whitespace=True, to_upper=True, min_length=1)
 
 
 class CurrencyBase(BaseModel):
@@ -28,7 +37,7 @@ class AccountBase(BaseModel):
     """ Базовый класс сериализации счетов
     """
     name: str
-    amount: float
+    amount: Money
     add_to_balance: bool = True
 
     class Config:
@@ -83,7 +92,7 @@ class BaseFinance(BaseModel):
     """ Базовый класс доходов и рассходов
     """
     title: str
-    amount: float = Field(..., gt=0)
+    amount: PositiveMoney
 
     class Config:
         orm_mode = True
@@ -110,6 +119,43 @@ class ExpenseSchema(BaseFinanceSchema):
     pass
 
 
+class BaseFinancePageSchema(BaseModel):
+    """ Базовый класс страницы доходов и рассходов
+    """
+    next_cursor: Union[str, None] = None
+
+
+class IncomePageSchema(BaseFinancePageSchema):
+    """ Страница списка доходов
+    """
+    items: List[IncomeSchema]
+
+
+class ExpensePageSchema(BaseFinancePageSchema):
+    """ Страница списка расходов
+    """
+    items: List[ExpenseSchema]
+
+
+class TransactionKind(str, Enum):
+    """ Вид записи: доход или расход
+    """
+    income = "income"
+    expense = "expense"
+
+
+class TransactionSchema(BaseFinanceSchema):
+    """ Доход или расход в общей ленте и результатах поиска
+    """
+    kind: TransactionKind
+
+
+class TransactionPageSchema(BaseFinancePageSchema):
+    """ Страница ленты доходов и расходов или результатов поиска
+    """
+    items: List[TransactionSchema]
+
+
 class CreateFinance(BaseFinance):
     """ Создание доходов и рассходов
     """
@@ -117,9 +163,199 @@ class CreateFinance(BaseFinance):
     account_id: int
 
 
+class ImportFinance(CreateFinance):
+    """ Импорт доходов и рассходов, дата по умолчанию - время импорта
+    """
+    date: Union[datetime, None] = None
+
+    @validator("date")
+    def date_to_utc(cls, value):
+        """ Даты в БД хранятся в naive utc, дата с часовым поясом переводится в utc
+        """
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
+class SyncFinanceSchema(BaseFinance):
+    """ Доход / расход для синхронизации клиента
+    """
+    id: int
+    date: datetime
+    category_id: int
+    account_id: int
+    updated_at: datetime
+
+
+class SyncAccountSchema(AccountBase):
+    """ Счет для синхронизации клиента
+    """
+    id: int
+    currency_id: int
+    updated_at: datetime
+
+
+class SyncCategorySchema(CategorySchema):
+    """ Категория для синхронизации клиента
+    """
+    updated_at: datetime
+
+
+class SyncCurrencySchema(CurrencySchema):
+    """ Валюта для синхронизации клиента
+    """
+    updated_at: datetime
+
+
+class TombstoneSchema(BaseModel):
+    """ Удаленная запись
+    """
+    entity: str
+    id: int
+    deleted_at: datetime
+
+
+class SyncSchema(BaseModel):
+    """ Изменения с предыдущей синхронизации. watermark передается в since при следующей синхронизации
+    """
+    watermark: datetime
+    income: List[SyncFinanceSchema]
+    expense: List[SyncFinanceSchema]
+    account: List[SyncAccountSchema]
+    category: List[SyncCategorySchema]
+    currency: List[SyncCurrencySchema]
+    deleted: List[TombstoneSchema]
+
+
+class BatchAction(str, Enum):
+    """ Действие в пакете изменений
+    """
+    create = "create"
+    update = "update"
+    delete = "delete"
+
+
+class EntityType(str, Enum):
+    """ Сущности пользователя (пакет изменений, количество записей)
+    """
+    income = "income"
+    expense = "expense"
+    account = "account"
+    category = "category"
+    currency = "currency"
+
+
+BATCH_DATA_SCHEMAS = {
+    EntityType.income: CreateFinance,
+    EntityType.expense: CreateFinance,
+    EntityType.account: CreateAccount,
+    EntityType.category: CreateCategory,
+    EntityType.currency: CreateCurrency,
+}
+
+
+class BatchOperation(BaseModel):
+    """ Операция пакета изменений. Для update и delete нужен id, для create и update - data
+    """
+    action: BatchAction
+    entity: EntityType
+    id: Union[int, None] = None
+    data: Union[dict, None] = None
+
+    @root_validator(skip_on_failure=True)
+    def validate_data(cls, values):
+        action = values["action"]
+        if action != BatchAction.create and values["id"] is None:
+            raise ValueError(f"id is required for {action.value}")
+        if action == BatchAction.delete:
+            values["data"] = None
+        elif values["data"] is None:
+            raise ValueError(f"data is required for {action.value}")
+        else:
+            values["data"] = BATCH_DATA_SCHEMAS[values["entity"]].parse_obj(values["data"])
+        return values
+
+
+class BatchResultSchema(BaseModel):
+    """ Результат операции пакета изменений
+    """
+    status: str
+    message: Union[str, None] = None
+
+
+class CountSchema(BaseModel):
+    """ Количество записей
+    """
+    count: int
+
+
+class CountsSchema(BaseModel):
+    """ Количество записей пользователя по сущностям
+    """
+    income: int
+    expense: int
+    account: int
+    category: int
+    currency: int
+
+
 class AccountSumSchema(BaseModel):
     currency: str = "USD"
-    amount: float = 1000
+    amount: Money = Decimal(1000)
+
+
+class ExchangeRateSchema(BaseModel):
+    """ Курс валюты: сколько единиц quote стоит одна единица base на дату.
+        Дата передается как 2026-01-01 или с временем 2026-01-01T00:00:00
+    """
+    date: Union[datetime, date]
+    base: CurrencyCode
+    quote: CurrencyCode
+    rate: condecimal(gt=0, max_digits=18, decimal_places=8)
+
+    @validator("date")
+    def date_to_datetime(cls, value):
+        """ Даты в БД хранятся в DateTime, дата без времени - начало дня
+        """
+        if isinstance(value, datetime):
+            return value
+        return datetime.combine(value, time())
+
+
+class SummaryGroup(str, Enum):
+    """ Группировка итогов
+    """
+    category = "category"
+    account = "account"
+    currency = "currency"
+
+
+class SummaryPeriod(str, Enum):
+    """ Период итогов
+    """
+    day = "day"
+    week = "week"
+    month = "month"
+
+
+class ExportFormat(str, Enum):
+    """ Формат выгрузки истории
+    """
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+class SummarySchema(BaseModel):
+    """ Итоги доходов или расходов по группе
+    """
+    kind: str
+    period: Union[datetime, None] = None
+    category_id: Union[int, None] = None
+    account_id: Union[int, None] = None
+    currency_id: Union[int, None] = None
+    currency: Union[str, None] = None
+    total: Money
+    count: int
 
 
 class MainSchema(BaseModel):
@@ -128,3 +364,4 @@ class MainSchema(BaseModel):
     account_sum: List[AccountSumSchema]
     income: List[IncomeSchema]
     expense: List[ExpenseSchema]
+    totals: List[SummarySchema] = []
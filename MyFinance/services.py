@@ -1,8 +1,27 @@
-from datetime import datetime
-from fastapi import status
+import base64
+import csv
+import io
+import json
+
+from config import FAST_JSON_RESPONSE, MAX_BATCH_OPERATIONS, MAX_IMPORT_ITEMS, SYNC_OVERLAP
+from core.responses import FastJSONResponse
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from fastapi import HTTPException, Request, status
 from fastapi.responses import JSONResponse
 from MyFinance import schemas
-from typing import List
+from pydantic import parse_obj_as
+from typing import AsyncIterator, List, Union
+
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl")
+EXPORT_COLUMNS = (
+    "kind", "id", "date", "title", "amount", "category_id", "category", "account_id", "account", "currency"
+)
+EXPORT_CHUNK_ROWS = 500
+# Клиент может хранить ответ, но должен проверять его через If-None-Match
+ETAG_CACHE_CONTROL = "private, no-cache"
+SEARCH_MIN_LENGTH = 2
 
 
 def create_formatted_datetime(start: str, end: str) -> tuple:
@@ -35,6 +54,166 @@ def get_formatted_datetime(start: str, end: str) -> tuple:
     return start_date, end_date
 
 
+def encode_cursor(date: datetime, pk: int, kind: Union[str, None] = None) -> str:
+    """ Кодирует ключ (date, id) последней записи страницы в непрозрачный курсор.
+        Для списков из доходов и расходов вместе в ключ добавляется kind
+    """
+    key = [date.isoformat(), pk] if kind is None else [date.isoformat(), pk, kind]
+    raw = json.dumps(key).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: Union[str, None], with_kind: bool = False) -> Union[tuple, None]:
+    """ Декодирует курсор, полученный из запроса, в ключ (date, id) или (date, id, kind)
+    """
+    if not cursor:
+        return None
+    try:
+        date, pk, *kind = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(kind) != int(with_kind):
+            raise ValueError("Unexpected cursor key")
+        return (datetime.fromisoformat(date), int(pk), *map(str, kind))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def prepare_page(rows: list, limit: int) -> dict:
+    """ Подготовка страницы списка. Репозиторий возвращает limit + 1 запись,
+        лишняя запись означает, что есть следующая страница
+    :param rows: Ответ бд
+    :param limit: Размер страницы
+    :return: Записи страницы и курсор следующей страницы
+    """
+    items = rows[:limit]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last["date"], last["id"], last.get("kind"))
+    return {
+        "items": items,
+        "next_cursor": next_cursor
+    }
+
+
+def prepare_page_response(
+        rows: list, limit: int, headers: Union[dict, None] = None
+) -> Union[dict, FastJSONResponse]:
+    """ Страница списка доходов / расходов. Строки репозитория уже в структуре
+        BaseFinanceSchema, поэтому при FAST_JSON_RESPONSE они сериализуются
+        напрямую, минуя валидацию response_model
+    """
+    page = prepare_page(rows, limit)
+    if FAST_JSON_RESPONSE:
+        return FastJSONResponse(page, headers=headers)
+    return page
+
+
+def get_sync_since(since: Union[datetime, None]) -> Union[datetime, None]:
+    """ Отметка синхронизации от клиента в naive utc, как хранятся даты в БД
+    """
+    if since is not None and since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+def get_sync_watermark() -> datetime:
+    """ Отметка для следующей синхронизации. Берется до чтения изменений и сдвигается на SYNC_OVERLAP,
+        чтобы не потерять записи транзакций, которые начались раньше, а завершились позже чтения.
+        Такие записи клиент может получить повторно
+    """
+    return datetime.utcnow() - timedelta(seconds=SYNC_OVERLAP)
+
+
+def prepare_sync_response(watermark: datetime, changes: dict) -> Union[dict, FastJSONResponse]:
+    """ Ответ синхронизации, строки репозитория уже в структуре SyncSchema
+    """
+    content = {"watermark": watermark, **changes}
+    if FAST_JSON_RESPONSE:
+        return FastJSONResponse(content)
+    return content
+
+
+def make_etag(user_id: int, version: int) -> str:
+    """ Слабый ETag по версии данных пользователя
+    """
+    return f'W/"{user_id}-{version}"'
+
+
+def etag_headers(etag: str) -> dict:
+    """ Заголовки ответа с ETag
+    """
+    return {"ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL}
+
+
+def check_not_modified(if_none_match: Union[str, None], etag: str):
+    """ Ответ 304, если клиент прислал актуальный ETag в If-None-Match
+    """
+    if not if_none_match:
+        return
+    # Для If-None-Match используется слабое сравнение, префикс W/ не учитывается
+    tags = {tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")}
+    if "*" in tags or etag.replace("W/", "", 1) in tags:
+        raise HTTPException(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers=etag_headers(etag)
+        )
+
+
+async def _read_ndjson(request: Request) -> List[schemas.ImportFinance]:
+    """ Построчный разбор NDJSON по мере получения тела запроса
+    """
+    items = []
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        items.extend(schemas.ImportFinance.parse_raw(line) for line in lines if line.strip())
+    if buffer.strip():
+        items.append(schemas.ImportFinance.parse_raw(buffer))
+    return items
+
+
+async def parse_import(request: Request) -> List[schemas.ImportFinance]:
+    """ Разбор тела запроса импорта: JSON массив или NDJSON
+    """
+    try:
+        if request.headers.get("content-type", "").startswith(NDJSON_CONTENT_TYPES):
+            items = await _read_ndjson(request)
+        else:
+            items = parse_obj_as(List[schemas.ImportFinance], json.loads(await request.body()))
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+    if not items or len(items) > MAX_IMPORT_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Expected from 1 to {MAX_IMPORT_ITEMS} items"
+        )
+    return items
+
+
+def prepare_search_query(q: str) -> str:
+    """ Строка поиска без пробелов по краям, короткие строки не принимаются,
+        иначе поиск вернул бы все записи
+    """
+    q = q.strip()
+    if len(q) < SEARCH_MIN_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Expected at least {SEARCH_MIN_LENGTH} non-space characters in q"
+        )
+    return q
+
+
+def check_batch(operations: List[schemas.BatchOperation]):
+    """ Проверка размера пакета изменений
+    """
+    if not operations or len(operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Expected from 1 to {MAX_BATCH_OPERATIONS} operations"
+        )
+
+
 def prepare_response(
         result: dict,
         success_status_code=status.HTTP_200_OK,
@@ -68,3 +247,35 @@ def prepare_account_sum(account_sum_db_result: List[dict]) -> List[schemas.Accou
         )
 
     return account_sum
+
+
+def _export_default(value):
+    """ Суммы выгружаются числами, остальные типы (даты) строками
+    """
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+async def export_lines(rows: AsyncIterator[dict], export_format: str) -> AsyncIterator[str]:
+    """ Построчная сериализация выгрузки в csv или ndjson.
+        Строки отдаются пачками, в памяти держится только текущая пачка
+    :param rows: Строки из бд
+    :param export_format: csv или ndjson
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == schemas.ExportFormat.csv:
+        writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    async for row in rows:
+        if export_format == schemas.ExportFormat.csv:
+            writer.writerow([row[column] for column in EXPORT_COLUMNS])
+        else:
+            buffer.write(json.dumps(row, default=_export_default, ensure_ascii=False) + "\n")
+        count += 1
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
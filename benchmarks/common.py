@@ -0,0 +1,75 @@
+import json
+import os
+import statistics
+import time
+
+from config import SQLALCHEMY_DATABASE_URL
+from core.engine import create_engine
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from typing import Awaitable, Callable
+
+
+BENCH_DB_URL = os.environ.get("BENCH_DB_URL") or SQLALCHEMY_DATABASE_URL
+BENCH_RESULTS_DIR = os.environ.get("BENCH_RESULTS_DIR", "bench_results")
+
+
+def get_engine() -> AsyncEngine:
+    """ Движок для бенчмарков без пула, чтобы замеры не зависели от прогрева соединений
+    """
+    return create_engine(BENCH_DB_URL, null_pool=True)
+
+
+def percentile(values: list, percent: float) -> float:
+    """ Перцентиль по методу ближайшего ранга
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(timings: list) -> dict:
+    """ Сводка по замерам в миллисекундах
+    """
+    timings_ms = [value * 1000 for value in timings]
+    return {
+        "runs": len(timings_ms),
+        "mean_ms": round(statistics.mean(timings_ms), 3),
+        "p50_ms": round(percentile(timings_ms, 50), 3),
+        "p95_ms": round(percentile(timings_ms, 95), 3),
+        "p99_ms": round(percentile(timings_ms, 99), 3),
+    }
+
+
+async def measure(func: Callable[[], Awaitable], repeat: int = 50, warmup: int = 3) -> dict:
+    """ Замер времени выполнения корутины
+    """
+    for _ in range(warmup):
+        await func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+async def explain(conn, query) -> list:
+    """ План выполнения запроса для postgres или sqlite
+    """
+    compiled = query.compile(conn.engine, compile_kwargs={"literal_binds": True})
+    if conn.engine.dialect.name == "sqlite":
+        result = await conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+        return [row[-1] for row in result.all()]
+    result = await conn.execute(text(f"EXPLAIN ANALYZE {compiled}"))
+    return [row[0] for row in result.all()]
+
+
+def save_results(name: str, results: dict) -> str:
+    """ Сохранение результатов в json для сравнения запусков
+    """
+    os.makedirs(BENCH_RESULTS_DIR, exist_ok=True)
+    path = os.path.join(BENCH_RESULTS_DIR, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, ensure_ascii=False, default=str)
+    return path
@@ -0,0 +1,67 @@
+""" Сравнение задержки главной страницы: все запросы в одной сессии
+    против параллельных запросов в отдельных сессиях
+
+    python -m benchmarks.dashboard --users 10 --rows 5000
+"""
+import argparse
+import asyncio
+
+from benchmarks.common import BENCH_DB_URL, measure, save_results
+from benchmarks.seed import seed
+from core import repository_entity
+from core.engine import create_engine, run_in_session
+from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+
+def get_dashboard_queries(user_id: int, start_date: datetime) -> list:
+    """ Запросы главной страницы в том виде, в котором их выполняет MyFinance.finance.main
+    """
+    return [
+        lambda session: repository_entity.AccountEntity(session).get_account_sum(user_id=user_id),
+        lambda session: repository_entity.IncomeEntity(session).get_income_list(user_id, start_date, None),
+        lambda session: repository_entity.ExpenseEntity(session).get_expense_list(user_id, start_date, None),
+        lambda session: repository_entity.SummaryEntity(session).get_summary(
+            user_id, start_date, None, group_by=[], period="month"
+        ),
+    ]
+
+
+async def main(users: int, rows: int, years: int, repeat: int, skip_seed: bool):
+    engine = create_engine(BENCH_DB_URL, null_pool=False)
+    if not skip_seed:
+        async with engine.begin() as conn:
+            await seed(conn, users, rows, years)
+    session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    queries = get_dashboard_queries(users // 2 + 1, datetime.utcnow() - timedelta(days=90))
+
+    async def shared_session():
+        async with session_maker() as session:
+            for query in queries:
+                await query(session)
+
+    async def fan_out():
+        await asyncio.gather(*(run_in_session(session_maker, query) for query in queries))
+
+    results = {
+        "shared_session": await measure(shared_session, repeat=repeat),
+        "fan_out": await measure(fan_out, repeat=repeat),
+    }
+    await engine.dispose()
+
+    for name, result in results.items():
+        print(f"{name:16} p50 {result['p50_ms']:>9.3f} ms  p95 {result['p95_ms']:>9.3f} ms")
+    path = save_results("dashboard", {"dialect": engine.dialect.name, "users": users, "rows_per_user": rows, **results})
+    print(f"Results saved to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /finance/ dashboard queries")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=5000, help="income and expense rows per user")
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--skip-seed", action="store_true", help="use already seeded database")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.rows, args.years, args.repeat, args.skip_seed))
@@ -0,0 +1,91 @@
+""" Сравнение планов и времени запросов доходов / расходов до и после
+    композитных индексов по пользователю
+
+    python -m benchmarks.indexes --users 20 --rows 20000
+"""
+import argparse
+import asyncio
+
+from benchmarks.common import get_engine, measure, explain, save_results
+from benchmarks.seed import seed
+from core.base import Income, Expense, Account, Category, Currency
+from datetime import datetime, timedelta
+from sqlalchemy import select, text
+
+
+INDEXES = [
+    index
+    for model in (Income, Expense, Account, Category, Currency)
+    for index in model.__table__.indexes
+    if index.name.startswith(f"ix_{model.__tablename__}_user_id")
+]
+
+
+def get_queries(user_id: int) -> dict:
+    """ Запросы в том виде, в котором их строит core.repository_entity
+    """
+    end_date = datetime.utcnow()
+    start_date = end_date - timedelta(days=30)
+    queries = {}
+    for model in (Income, Expense):
+        name = model.__tablename__
+        page = select(model).filter(model.user_id == user_id).order_by(model.date.desc(), model.id.desc())
+        queries[f"{name}_first_page"] = page.limit(101)
+        queries[f"{name}_month"] = page.filter(model.date >= start_date, model.date <= end_date).limit(101)
+        queries[f"{name}_category_month"] = page.filter(
+            model.category_id == select(model.category_id).filter(model.user_id == user_id).limit(1).scalar_subquery(),
+            model.date >= start_date,
+            model.date <= end_date
+        ).limit(101)
+    queries["account_list"] = select(Account).filter(Account.user_id == user_id)
+    return queries
+
+
+async def run_queries(engine, user_id: int, repeat: int) -> dict:
+    results = {}
+    async with engine.connect() as conn:
+        for name, query in get_queries(user_id).items():
+            results[name] = {
+                "plan": await explain(conn, query),
+                **await measure(lambda: conn.execute(query), repeat=repeat),
+            }
+    return results
+
+
+async def main(users: int, rows: int, years: int, repeat: int):
+    engine = get_engine()
+    async with engine.begin() as conn:
+        await seed(conn, users, rows, years)
+        for index in INDEXES:
+            await conn.run_sync(index.drop, checkfirst=True)
+        await conn.execute(text("ANALYZE"))
+    user_id = users // 2 + 1
+    before = await run_queries(engine, user_id, repeat)
+
+    async with engine.begin() as conn:
+        for index in INDEXES:
+            await conn.run_sync(index.create, checkfirst=True)
+        await conn.execute(text("ANALYZE"))
+    after = await run_queries(engine, user_id, repeat)
+    await engine.dispose()
+
+    for name in before:
+        print(f"{name:32} {before[name]['p50_ms']:>10.3f} ms -> {after[name]['p50_ms']:>10.3f} ms (p50)")
+    path = save_results("indexes", {
+        "dialect": engine.dialect.name,
+        "users": users,
+        "rows_per_user": rows,
+        "before": before,
+        "after": after,
+    })
+    print(f"Results saved to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-user composite indexes")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=20000, help="income and expense rows per user")
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.rows, args.years, args.repeat))
@@ -0,0 +1,136 @@
+""" Нагрузочный тест приложения main.app в процессе через ASGI транспорт httpx:
+    задержки p50 / p95 / p99 и пропускная способность по эндпоинтам.
+    Требует пакет httpx
+
+    python -m benchmarks.load --users 10 --rows 5000 --requests 500 --concurrency 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from benchmarks.common import BENCH_DB_URL, save_results, summarize
+from benchmarks.seed import seed
+from core.engine import (
+    create_engine, get_async_session, get_read_session, get_read_session_maker
+)
+from datetime import datetime, timedelta
+from main import app
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from users.auth import cookie_transport, get_jwt_strategy
+from users.schemas import UserClaims
+
+
+def get_endpoints() -> dict:
+    """ Эндпоинты, которые клиенты вызывают чаще всего
+    """
+    now = datetime.utcnow()
+    since = (now - timedelta(days=1)).isoformat()
+    # Главная страница за текущий месяц, как ее открывают клиенты
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M:%S.%f")
+    return {
+        "dashboard_month": f"/finance/?start_date_str={month_start}",
+        "income_list": "/finance/income?limit=100",
+        "expense_list": "/finance/expense?limit=100",
+        "transactions": "/finance/transactions?limit=100",
+        "account_list": "/finance/account",
+        "category_list": "/finance/category",
+        "summary_by_category": "/finance/summary?group_by=category&period=month",
+        "sync_since_day": f"/finance/sync?since={since}",
+    }
+
+
+async def get_cookies(user_ids: list) -> dict:
+    """ Cookie авторизации для пользователей, токены выпускаются той же стратегией, что и при входе
+    """
+    strategy = get_jwt_strategy()
+    cookies = {}
+    for user_id in user_ids:
+        token = await strategy.write_token(UserClaims(id=user_id, is_verified=True))
+        cookies[user_id] = {cookie_transport.cookie_name: token}
+    return cookies
+
+
+async def run_endpoint(client: httpx.AsyncClient, url: str, cookies: dict, requests: int, concurrency: int) -> dict:
+    """ requests запросов к url из concurrency параллельных клиентов от случайных пользователей
+    """
+    rnd = random.Random(42)
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(rnd.choice(list(cookies.values())))
+    timings, statuses = [], {}
+
+    async def worker():
+        while not queue.empty():
+            user_cookies = queue.get_nowait()
+            start = time.perf_counter()
+            response = await client.get(url, cookies=user_cookies)
+            timings.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        **summarize(timings),
+        "rps": round(len(timings) / elapsed, 1),
+        "statuses": statuses,
+    }
+
+
+async def main(users: int, rows: int, years: int, requests: int, concurrency: int, skip_seed: bool):
+    engine = create_engine(BENCH_DB_URL, null_pool=False)
+    if not skip_seed:
+        async with engine.begin() as conn:
+            await seed(conn, users, rows, years)
+
+    # Приложение работает с БД бенчмарка независимо от DB_URL
+    session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def get_bench_session():
+        async with session_maker() as session:
+            yield session
+
+    app.dependency_overrides[get_async_session] = get_bench_session
+    app.dependency_overrides[get_read_session] = get_bench_session
+    app.dependency_overrides[get_read_session_maker] = lambda: session_maker
+
+    cookies = await get_cookies(list(range(1, users + 1)))
+    results = {}
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        for name, url in get_endpoints().items():
+            # Прогрев: кэш справочников, пул соединений
+            await run_endpoint(client, url, cookies, concurrency, concurrency)
+            results[name] = await run_endpoint(client, url, cookies, requests, concurrency)
+            result = results[name]
+            print(
+                f"{name:20} p50 {result['p50_ms']:>9.3f} ms  p95 {result['p95_ms']:>9.3f} ms  "
+                f"p99 {result['p99_ms']:>9.3f} ms  {result['rps']:>8.1f} req/s  {result['statuses']}"
+            )
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+    path = save_results("load", {
+        "dialect": engine.dialect.name,
+        "users": users,
+        "rows_per_user": rows,
+        "requests": requests,
+        "concurrency": concurrency,
+        **results
+    })
+    print(f"Results saved to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-process load test of the finance API")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=5000, help="income and expense rows per user")
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--skip-seed", action="store_true", help="use already seeded database")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.rows, args.years, args.requests, args.concurrency, args.skip_seed))
@@ -0,0 +1,135 @@
+""" Микро-бенчмарки запросов core.repository_entity и функций MyFinance.services
+
+    python -m benchmarks.micro --users 10 --rows 5000
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.common import BENCH_DB_URL, measure, percentile, save_results
+from benchmarks.seed import seed
+from core import repository_entity
+from core.engine import create_engine
+from datetime import datetime, timedelta
+from MyFinance import services
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+
+def get_repository_cases(user_id: int, category_id: int) -> dict:
+    """ Запросы репозитория с параметрами, которые передают эндпоинты.
+        Справочники читаются в обход кэша, чтобы мерить запрос
+    """
+    now = datetime.utcnow()
+    month_ago = now - timedelta(days=30)
+    after = (now - timedelta(days=180), 2 ** 31)
+    return {
+        "income_first_page": lambda session: repository_entity.IncomeEntity(session).get_income_list(
+            user_id, None, None, limit=100
+        ),
+        "expense_page_after_cursor": lambda session: repository_entity.ExpenseEntity(session).get_expense_list(
+            user_id, None, None, after=after, limit=100
+        ),
+        "expense_by_category_month": lambda session: repository_entity.ExpenseEntity(
+            session
+        ).get_expense_list_by_category(category_id, user_id, month_ago, now, limit=100),
+        "expense_sum_month": lambda session: repository_entity.ExpenseEntity(session).get_expense_sum(
+            user_id, month_ago, now
+        ),
+        "account_sum": lambda session: repository_entity.AccountEntity(session).get_account_sum(user_id),
+        "account_list": lambda session: repository_entity.AccountEntity(session)._get_account_list(user_id),
+        "category_list": lambda session: repository_entity.CategoryEntity(session)._get_category_list(user_id),
+        "summary_month_rollup": lambda session: repository_entity.SummaryEntity(session).get_summary(
+            user_id, None, None, group_by=["category"], period="month"
+        ),
+        "summary_day_raw": lambda session: repository_entity.SummaryEntity(session).get_summary(
+            user_id, month_ago, now, group_by=["category"], period="day"
+        ),
+        "sync_since_day": lambda session: repository_entity.SyncEntity(session).get_changes(
+            user_id, now - timedelta(days=1)
+        ),
+        "data_version": lambda session: repository_entity.DataVersionEntity(session).get_version(user_id),
+    }
+
+
+def get_services_cases(page_rows: list) -> dict:
+    """ Функции сервисного слоя на данных, похожих на ответ репозитория
+    """
+    cursor = services.encode_cursor(datetime.utcnow(), 123456)
+    etag = services.make_etag(1, 42)
+    return {
+        "encode_cursor": lambda: services.encode_cursor(datetime.utcnow(), 123456),
+        "decode_cursor": lambda: services.decode_cursor(cursor),
+        "get_formatted_datetime": lambda: services.get_formatted_datetime(
+            "2023-01-01T00:00:00.000000", "2023-02-01T00:00:00.000000"
+        ),
+        "prepare_page": lambda: services.prepare_page(page_rows, 100),
+        "prepare_page_response": lambda: services.prepare_page_response(page_rows, 100, services.etag_headers(etag)),
+        "check_not_modified": lambda: services.check_not_modified('W/"1-41", W/"2-42"', etag),
+    }
+
+
+def measure_sync(func, number: int = 1000, repeat: int = 20) -> dict:
+    """ Замер синхронной функции сериями по number вызовов, в микросекундах на вызов
+    """
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number * 1e6)
+    return {
+        "runs": repeat * number,
+        "p50_us": round(percentile(timings, 50), 3),
+        "p95_us": round(percentile(timings, 95), 3),
+        "p99_us": round(percentile(timings, 99), 3),
+    }
+
+
+async def main(users: int, rows: int, years: int, repeat: int, skip_seed: bool):
+    engine = create_engine(BENCH_DB_URL, null_pool=False)
+    if not skip_seed:
+        async with engine.begin() as conn:
+            await seed(conn, users, rows, years)
+    session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    user_id = users // 2 + 1
+    # Категории расходов пользователя идут после пяти категорий доходов, см. benchmarks.seed
+    category_id = (user_id - 1) * 10 + 6
+
+    repository = {}
+    for name, case in get_repository_cases(user_id, category_id).items():
+        async def run(case=case):
+            async with session_maker() as session:
+                await case(session)
+        repository[name] = await measure(run, repeat=repeat)
+        print(f"{name:28} p50 {repository[name]['p50_ms']:>9.3f} ms  p95 {repository[name]['p95_ms']:>9.3f} ms")
+
+    async with session_maker() as session:
+        page_rows = await repository_entity.IncomeEntity(session).get_income_list(user_id, None, None, limit=100)
+    await engine.dispose()
+
+    helpers = {}
+    for name, case in get_services_cases(page_rows).items():
+        helpers[name] = measure_sync(case)
+        print(f"{name:28} p50 {helpers[name]['p50_us']:>9.3f} us  p95 {helpers[name]['p95_us']:>9.3f} us")
+
+    path = save_results("micro", {
+        "dialect": engine.dialect.name,
+        "users": users,
+        "rows_per_user": rows,
+        "repository": repository,
+        "services": helpers,
+    })
+    print(f"Results saved to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of repository queries and services helpers")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=5000, help="income and expense rows per user")
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--skip-seed", action="store_true", help="use already seeded database")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.rows, args.years, args.repeat, args.skip_seed))
@@ -0,0 +1,80 @@
+""" Сравнение чтения списков через ORM объекты с joined загрузкой
+    и через выборку колонок. Считается CPU время и память на строку
+
+    python -m benchmarks.projection --rows 20000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from benchmarks.common import get_engine, save_results
+from benchmarks.seed import seed
+from core.base import Income, Account
+from core.repository_entity import FinanceEntityBase
+from MyFinance.schemas import IncomeSchema
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+
+async def read_orm(session, user_id: int) -> list:
+    query = select(Income).\
+        options(joinedload(Income.category), joinedload(Income.account).joinedload(Account.currency)).\
+        filter(Income.user_id == user_id)
+    result = await session.execute(query)
+    return [IncomeSchema.from_orm(row) for row in result.scalars().unique()]
+
+
+async def read_columns(session, user_id: int) -> list:
+    query = FinanceEntityBase._select_finance_columns(Income).filter(Income.user_id == user_id)
+    result = await session.execute(query)
+    return [IncomeSchema.parse_obj(FinanceEntityBase._finance_item(row)) for row in result.all()]
+
+
+async def profile(engine, reader, user_id: int, repeat: int) -> dict:
+    """ CPU время и пик выделенной памяти на одну строку.
+        Память меряется отдельным проходом, tracemalloc сильно замедляет выполнение
+    """
+    cpu_times, rows = [], 0
+    for _ in range(repeat):
+        async with AsyncSession(engine) as session:
+            start = time.process_time()
+            rows = len(await reader(session, user_id))
+            cpu_times.append(time.process_time() - start)
+
+    async with AsyncSession(engine) as session:
+        tracemalloc.start()
+        await reader(session, user_id)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        "rows": rows,
+        "cpu_us_per_row": round(min(cpu_times) / rows * 1e6, 2),
+        "peak_bytes_per_row": round(peak / rows),
+    }
+
+
+async def main(rows: int, repeat: int):
+    engine = get_engine()
+    async with engine.begin() as conn:
+        await seed(conn, users=1, rows=rows, years=3)
+
+    results = {
+        "orm_joined": await profile(engine, read_orm, 1, repeat),
+        "columns": await profile(engine, read_columns, 1, repeat),
+    }
+    await engine.dispose()
+
+    for name, result in results.items():
+        print(f"{name:12} {result['cpu_us_per_row']:>8.2f} us/row  {result['peak_bytes_per_row']:>8} bytes/row")
+    path = save_results("projection", {"dialect": engine.dialect.name, **results})
+    print(f"Results saved to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ORM vs column projection list reads")
+    parser.add_argument("--rows", type=int, default=20000, help="income and expense rows")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,129 @@
+""" Заполнение БД тестовыми данными для бенчмарков
+
+    python -m benchmarks.seed --users 10 --rows 5000 --years 3
+"""
+import argparse
+import asyncio
+import random
+
+from benchmarks.common import get_engine
+from core.base import (
+    Base, User, Currency, Account, Category, Income, Expense, MonthlyRollup, DataVersion, Tombstone
+)
+from core.repository_entity import RollupEntity
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import insert, delete
+
+
+CURRENCIES = ("RUB", "USD", "EUR")
+INCOME_TITLES = ("Salary", "Bonus", "Cashback", "Dividends", "Freelance")
+EXPENSE_TITLES = ("Groceries", "Uber ride", "Coffee", "Rent", "Cinema", "Pharmacy", "Taxi", "Restaurant")
+CHUNK_SIZE = 5000
+
+
+async def _insert_chunks(conn, model, rows: list):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        await conn.execute(insert(model), rows[start:start + CHUNK_SIZE])
+
+
+def _finance_rows(rnd: random.Random, user_id: int, rows: int, years: int, titles: tuple,
+                  accounts: list, categories: list) -> list:
+    now = datetime.utcnow()
+    period = timedelta(days=365 * years).total_seconds()
+    dates = [now - timedelta(seconds=rnd.uniform(0, period)) for _ in range(rows)]
+    return [
+        {
+            "title": rnd.choice(titles),
+            "amount": Decimal(rnd.randrange(100, 500000)).scaleb(-2),
+            "account_id": rnd.choice(accounts),
+            "category_id": rnd.choice(categories),
+            "date": date,
+            # Записи не менялись после создания, как большая часть истории у реальных пользователей
+            "updated_at": date,
+            "user_id": user_id,
+        }
+        for date in dates
+    ]
+
+
+async def seed(conn, users: int = 10, rows: int = 5000, years: int = 3, seed_value: int = 42) -> dict:
+    """ Создание пользователей со счетами, категориями, историей доходов / расходов и месячными итогами
+    :param users: Количество пользователей
+    :param rows: Количество доходов и расходов на пользователя
+    :param years: Глубина истории в годах
+    :return: Идентификаторы созданных пользователей
+    """
+    rnd = random.Random(seed_value)
+    await conn.run_sync(Base.metadata.create_all)
+    for model in (MonthlyRollup, DataVersion, Tombstone, Income, Expense, Account, Category, Currency, User):
+        await conn.execute(delete(model))
+
+    await conn.execute(insert(Currency), [{"id": pk, "name": name} for pk, name in enumerate(CURRENCIES, 1)])
+    await conn.execute(insert(User), [
+        {
+            "id": user_id,
+            "email": f"user{user_id}@example.com",
+            "hashed_password": "-",
+            "is_active": True,
+            "is_superuser": False,
+            "is_verified": True,
+        }
+        for user_id in range(1, users + 1)
+    ])
+
+    account_id = category_id = 0
+    for user_id in range(1, users + 1):
+        accounts, categories = [], []
+        account_rows, category_rows = [], []
+        for currency_id in range(1, len(CURRENCIES) + 1):
+            account_id += 1
+            accounts.append(account_id)
+            account_rows.append({
+                "id": account_id, "name": f"Account {account_id}", "currency_id": currency_id,
+                "amount": 0, "add_to_balance": True, "user_id": user_id, "updated_at": datetime.utcnow(),
+            })
+        for category_type in ("income", "expense"):
+            for _ in range(5):
+                category_id += 1
+                categories.append(category_id)
+                category_rows.append({
+                    "id": category_id, "name": f"Category {category_id}", "category_type": category_type,
+                    "user_id": user_id,
+                })
+        await conn.execute(insert(Account), account_rows)
+        await conn.execute(insert(Category), category_rows)
+        await _insert_chunks(conn, Income, _finance_rows(
+            rnd, user_id, rows // 4, years, INCOME_TITLES, accounts, categories[:5]
+        ))
+        await _insert_chunks(conn, Expense, _finance_rows(
+            rnd, user_id, rows - rows // 4, years, EXPENSE_TITLES, accounts, categories[5:]
+        ))
+
+    user_ids = list(range(1, users + 1))
+    columns = ["user_id", "month", "category_id", "account_id", "kind", "total", "count"]
+    for model in (Income, Expense):
+        await conn.execute(insert(MonthlyRollup).from_select(columns, RollupEntity._rollup_rows(model, user_ids)))
+
+    if conn.engine.dialect.name == "postgresql":
+        for table in ("currency", "user", "account", "category"):
+            await conn.exec_driver_sql(
+                f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT max(id) FROM \"{table}\"))"
+            )
+    return {"users": user_ids}
+
+
+async def main(users: int, rows: int, years: int):
+    engine = get_engine()
+    async with engine.begin() as conn:
+        await seed(conn, users, rows, years)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed database for benchmarks")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=5000, help="income and expense rows per user")
+    parser.add_argument("--years", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.rows, args.years))
@@ -0,0 +1,68 @@
+""" Сравнение сериализации страницы списка через response_model
+    (валидация pydantic, jsonable_encoder, json) и через FastJSONResponse
+
+    python -m benchmarks.serialization --rows 10000
+"""
+import argparse
+import asyncio
+import json
+
+from benchmarks.common import get_engine, measure, save_results
+from benchmarks.seed import seed
+from core import responses
+from core.base import Income
+from core.repository_entity import FinanceEntityBase
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from MyFinance import services
+from MyFinance.schemas import IncomePageSchema
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import JSONResponse
+
+
+async def load_page(engine, rows: int) -> dict:
+    query = FinanceEntityBase._select_finance_columns(Income).filter(Income.user_id == 1).limit(rows)
+    async with AsyncSession(engine) as session:
+        result = await session.execute(query)
+        return services.prepare_page([FinanceEntityBase._finance_item(row) for row in result.all()], rows)
+
+
+async def main(rows: int, repeat: int):
+    engine = get_engine()
+    async with engine.begin() as conn:
+        await seed(conn, users=1, rows=rows, years=3)
+    page = await load_page(engine, rows)
+    await engine.dispose()
+
+    field = create_response_field(name="response", type_=IncomePageSchema)
+
+    async def response_model() -> bytes:
+        content = await serialize_response(field=field, response_content=page)
+        return JSONResponse(content).body
+
+    async def fast_json() -> bytes:
+        return responses.FastJSONResponse(page).body
+
+    if json.loads(await response_model()) != json.loads(await fast_json()):
+        raise SystemExit("FastJSONResponse output differs from response_model output")
+
+    results = {
+        "response_model": await measure(response_model, repeat=repeat),
+        "fast_json": await measure(fast_json, repeat=repeat),
+    }
+    for name, result in results.items():
+        print(f"{name:15} p50 {result['p50_ms']:>9.3f} ms  p95 {result['p95_ms']:>9.3f} ms")
+    path = save_results("serialization", {
+        "rows": len(page["items"]),
+        "orjson": responses.orjson is not None,
+        **results
+    })
+    print(f"Results saved to {path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark list page serialization")
+    parser.add_argument("--rows", type=int, default=10000, help="income and expense rows")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,36 @@
+""" Загрузка курсов валют из локального csv файла с заголовком date,base,quote,rate:
+    date - дата курса 2026-01-01 (или 2026-01-01T00:00:00), base и quote - коды валют,
+    rate - сколько единиц quote стоит одна единица base, например 2026-01-01,USD,RUB,90.5
+
+    python -m commands.load_exchange_rates rates.csv
+"""
+import argparse
+import asyncio
+import csv
+
+from config import logger
+from core.engine import async_session_maker, engine
+from core.repository_entity import ExchangeRateEntity
+from MyFinance.schemas import ExchangeRateSchema
+
+
+def read_rates(path: str) -> list:
+    with open(path, newline="") as file:
+        return [ExchangeRateSchema.parse_obj(row) for row in csv.DictReader(file)]
+
+
+async def load_exchange_rates(path: str):
+    rates = read_rates(path)
+    async with async_session_maker() as session:
+        count = await ExchangeRateEntity(session).load(rates)
+    logger.info(f"Loaded {count} exchange rates from {path}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load exchange rates from a csv file")
+    parser.add_argument(
+        "path", help="csv file with a date,base,quote,rate header, e.g. 2026-01-01,USD,RUB,90.5 (1 USD = 90.5 RUB)"
+    )
+    args = parser.parse_args()
+    asyncio.run(load_exchange_rates(args.path))
@@ -0,0 +1,65 @@
+""" Обслуживание секций доходов и расходов: создание будущих секций заранее
+    и отсоединение старых в схему архива (или удаление с --drop) вместе с их месячными итогами
+
+    python -m commands.partitions --ahead 3 --retain 60 --archive-schema archive
+"""
+import argparse
+import asyncio
+
+from config import PARTITION_AHEAD, PARTITION_INTERVAL, logger
+from core.engine import engine
+from core.partitions import (
+    PARTITIONED_TABLES, create_partition_statements, detach_partition_statements, detach_rollup_statements,
+    list_partitions_query, next_period, parse_partition_name, partition_name, period_start, shift_periods
+)
+from datetime import datetime
+from MyFinance.models import DataVersion
+from sqlalchemy import text, update
+from typing import Union
+
+
+async def execute(conn, statements: list):
+    for statement in statements:
+        await conn.execute(text(statement))
+
+
+async def maintain_partitions(ahead: int, retain: Union[int, None], archive_schema: Union[str, None]):
+    now = datetime.utcnow()
+    for table in PARTITIONED_TABLES:
+        async with engine.begin() as conn:
+            names = list((await conn.execute(text(list_partitions_query(table)))).scalars())
+            bounds = {name: parse_partition_name(table, name) for name in names}
+            bounds = {name: value for name, value in bounds.items() if value}
+
+            start = period_start(now, PARTITION_INTERVAL)
+            while start <= shift_periods(now, PARTITION_INTERVAL, ahead):
+                end = next_period(start, PARTITION_INTERVAL)
+                # Период уже покрыт секцией, в том числе созданной с другим интервалом
+                if not any(low < end and start < high for low, high in bounds.values()):
+                    await execute(conn, create_partition_statements(table, start, PARTITION_INTERVAL))
+                    logger.info(f"Created partition {partition_name(table, start, PARTITION_INTERVAL)}")
+                start = end
+
+            if retain is None:
+                continue
+            border = shift_periods(now, PARTITION_INTERVAL, -retain)
+            detached = [name for name, (_, high) in sorted(bounds.items()) if high <= border]
+            for name in detached:
+                await execute(conn, detach_partition_statements(table, name, archive_schema))
+                # Итоги по отсоединенным записям уходят вместе с секцией в той же транзакции
+                await execute(conn, detach_rollup_statements(table, *bounds[name], archive_schema))
+                logger.info(f"Detached partition {name}")
+            if detached:
+                # Списки пользователей изменились, их ETag должен смениться
+                await conn.execute(update(DataVersion).values(version=DataVersion.version + 1))
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create future income and expense partitions, detach old ones")
+    parser.add_argument("--ahead", type=int, default=PARTITION_AHEAD, help="periods to create in advance")
+    parser.add_argument("--retain", type=int, default=None, help="periods to keep attached, all by default")
+    parser.add_argument("--archive-schema", default="archive", help="schema for detached partitions")
+    parser.add_argument("--drop", action="store_true", help="drop detached partitions instead of archiving")
+    args = parser.parse_args()
+    asyncio.run(maintain_partitions(args.ahead, args.retain, None if args.drop else args.archive_schema))
@@ -0,0 +1,33 @@
+""" Пересчет месячных итогов доходов и расходов по существующим данным
+
+    python -m commands.rebuild_rollups --batch-size 100
+"""
+import argparse
+import asyncio
+
+from config import logger
+from core.engine import async_session_maker, engine
+from core.repository_entity import RollupEntity
+from sqlalchemy import select
+from users.models import User
+
+
+async def rebuild_rollups(batch_size: int):
+    last_id = 0
+    while True:
+        async with async_session_maker() as session:
+            query = select(User.id).filter(User.id > last_id).order_by(User.id).limit(batch_size)
+            user_ids = list((await session.execute(query)).scalars())
+            if not user_ids:
+                break
+            await RollupEntity(session).rebuild(user_ids)
+        last_id = user_ids[-1]
+        logger.info(f"Rebuilt monthly rollups for users {user_ids[0]}..{last_id}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild monthly income and expense rollups")
+    parser.add_argument("--batch-size", type=int, default=100, help="users per transaction")
+    args = parser.parse_args()
+    asyncio.run(rebuild_rollups(args.batch_size))
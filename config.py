@@ -43,9 +43,53 @@ logger = logging.getLogger(logger_mode)
 
 SQLALCHEMY_DATABASE_URL = os.environ.get('DB_URL')
 
+# Настройки пула соединений с БД. DB_NULL_POOL=1 отключает пул (alembic, тесты)
+DB_NULL_POOL = bool(int(os.environ.get('DB_NULL_POOL', 0)))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = bool(int(os.environ.get('DB_POOL_PRE_PING', 1)))
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 100))
+# Реплика БД для эндпоинтов только на чтение (по умолчанию не используется) и время,
+# на которое после изменения данных чтения пользователя остаются на основной БД, сек
+DB_REPLICA_URL = os.environ.get('DB_REPLICA_URL')
+DB_REPLICA_STICKY = int(os.environ.get('DB_REPLICA_STICKY', 5))
+# Лог медленных запросов: порог в мс (0 - выключен) и вывод параметров запроса
+DB_SLOW_QUERY_MS = int(os.environ.get('DB_SLOW_QUERY_MS', 0))
+DB_SLOW_QUERY_PARAMS = bool(int(os.environ.get('DB_SLOW_QUERY_PARAMS', 0)))
+
+# Размер страницы списков доходов / расходов
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', 100))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+# Отдавать списки без повторной валидации схемой ответа (orjson, если установлен)
+FAST_JSON_RESPONSE = bool(int(os.environ.get('FAST_JSON_RESPONSE', 1)))
+# Перекрытие отметки синхронизации на время незавершенных транзакций, сек
+SYNC_OVERLAP = int(os.environ.get('SYNC_OVERLAP', 5))
+
+# Секционирование доходов и расходов по дате: month или year, и сколько будущих секций создавать заранее
+PARTITION_INTERVAL = os.environ.get('PARTITION_INTERVAL', 'month')
+PARTITION_AHEAD = int(os.environ.get('PARTITION_AHEAD', 3))
+
+# Максимальное количество записей в одном запросе импорта
+MAX_IMPORT_ITEMS = int(os.environ.get('MAX_IMPORT_ITEMS', 50000))
+# Максимальное количество операций в пакете изменений
+MAX_BATCH_OPERATIONS = int(os.environ.get('MAX_BATCH_OPERATIONS', 1000))
+
+# Кэш справочников: memory, redis или none
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 300))
+CACHE_MAX_SIZE = int(os.environ.get('CACHE_MAX_SIZE', 10000))
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+# Время жизни последних курсов валют в памяти процесса, сек
+EXCHANGE_RATE_TTL = int(os.environ.get('EXCHANGE_RATE_TTL', 3600))
 
 SECRET = os.environ.get('SECRET')
 
+# Авторизация по полям JWT без запроса пользователя из БД
+AUTH_STATELESS = bool(int(os.environ.get('AUTH_STATELESS', 0)))
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+
 MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
 MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
 MAIL_EMAIL = os.environ.get('MAIL_EMAIL')
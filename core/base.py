@@ -1,3 +1,4 @@
-from MyFinance.models import Expense, Income, Currency, Account, Category
+from MyFinance.models import Expense, Income, Currency, Account, Category, MonthlyRollup, DataVersion, Tombstone, \
+    ExchangeRate
 from core.engine import Base
 from users.models import User
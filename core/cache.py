@@ -0,0 +1,111 @@
+import json
+import time
+
+from collections import OrderedDict
+from config import CACHE_BACKEND, CACHE_TTL, CACHE_MAX_SIZE, REDIS_URL
+from core.metrics import registry
+from typing import Awaitable, Callable, Union
+
+
+cache_hits = registry.counter("cache_hits_total", "Reference data cache hits")
+cache_misses = registry.counter("cache_misses_total", "Reference data cache misses")
+
+
+class MemoryBackend:
+    """ LRU кэш в памяти процесса с временем жизни записей
+    """
+    def __init__(self, max_size: int = CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()
+
+    async def get(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: int):
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._data.pop(key, None)
+
+
+class RedisBackend:
+    """ Кэш в Redis. Принимает любой клиент с асинхронными get / set(ex=) / delete,
+        например redis.asyncio.Redis или его заглушку в тестах
+    """
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, key: str):
+        value = await self.client.get(key)
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: str, value, ttl: int):
+        await self.client.set(key, json.dumps(value, default=str), ex=ttl)
+
+    async def delete(self, *keys: str):
+        await self.client.delete(*keys)
+
+
+class Cache:
+    """ Кэш справочников пользователя (категории, валюты, счета)
+    """
+    def __init__(self, backend: Union[MemoryBackend, RedisBackend, None], ttl: int = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def key(name: str, user_id: int, version: Union[str, None] = None) -> str:
+        return f"{name}:{user_id}" if version is None else f"{name}:{user_id}:{version}"
+
+    async def get_or_set(
+            self, name: str, user_id: int, loader: Callable[[], Awaitable], version: Union[str, None] = None
+    ):
+        """ Значение из кэша, при промахе загружается из БД и сохраняется
+        :param name: Название справочника
+        :param user_id: Текущий пользователь
+        :param loader: Загрузка значения из БД
+        :param version: Версия данных пользователя (ETag ответа). Входит в ключ, поэтому после изменения
+            не сброшенный в других воркерах memory кэш не используется и ответ всегда соответствует ETag
+        """
+        if self.backend is None:
+            return await loader()
+        key = self.key(name, user_id, version)
+        value = await self.backend.get(key)
+        if value is not None:
+            cache_hits.inc(name=name)
+            return value
+        cache_misses.inc(name=name)
+        value = await loader()
+        await self.backend.set(key, value, self.ttl)
+        return value
+
+    async def invalidate(self, user_id: int, *names: str):
+        """ Сброс справочников пользователя после изменения
+        """
+        if self.backend is not None and names:
+            await self.backend.delete(*(self.key(name, user_id) for name in names))
+
+
+def create_cache() -> Cache:
+    if CACHE_BACKEND == "redis":
+        from redis.asyncio import Redis
+
+        return Cache(RedisBackend(Redis.from_url(REDIS_URL)))
+    if CACHE_BACKEND == "memory":
+        return Cache(MemoryBackend())
+    return Cache(None)
+
+
+cache = create_cache()
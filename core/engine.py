@@ -1,18 +1,160 @@
-from config import SQLALCHEMY_DATABASE_URL
-from typing import AsyncGenerator
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import time
+
+from config import (
+    SQLALCHEMY_DATABASE_URL, DB_NULL_POOL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING, DB_STATEMENT_CACHE_SIZE, DB_SLOW_QUERY_MS, DB_SLOW_QUERY_PARAMS, DB_REPLICA_URL, logger
+)
+from contextvars import ContextVar
+from core.metrics import registry
+from typing import AsyncGenerator, Awaitable, Callable, Union
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from starlette.requests import Request
+
+
+pool_checkout_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a connection from the pool"
+)
+
+# Cookie, с которой чтения пользователя идут на основную БД, чтобы он видел свои изменения
+READ_PRIMARY_COOKIE = "read_primary"
+
+
+query_duration = registry.histogram("db_query_duration_seconds", "Time spent executing SQL statements")
+slow_queries = registry.counter("db_slow_queries_total", "SQL statements slower than DB_SLOW_QUERY_MS")
+
+
+class QueryStats:
+    """ Количество и суммарное время запросов к БД в рамках одного HTTP запроса
+    """
+    __slots__ = ("count", "duration")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# Задается middleware на время запроса. Задачи asyncio.gather и greenlet SQLAlchemy
+# получают копию контекста, поэтому пишут в тот же объект
+query_stats: ContextVar[Union[QueryStats, None]] = ContextVar("query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context._query_start
+    query_duration.observe(duration)
+    stats = query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.duration += duration
+    if DB_SLOW_QUERY_MS and duration * 1000 >= DB_SLOW_QUERY_MS:
+        slow_queries.inc()
+        if DB_SLOW_QUERY_PARAMS:
+            logger.warning("Slow query %.1f ms: %s; parameters: %r", duration * 1000, statement, parameters)
+        else:
+            logger.warning("Slow query %.1f ms: %s", duration * 1000, statement)
+
 
+def instrument_engine(async_engine: AsyncEngine):
+    """ Замер времени запросов к БД через события движка
+    """
+    event.listen(async_engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(async_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
 
-engine = create_async_engine(SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """ Пул соединений с замером времени ожидания свободного соединения
+    """
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - start)
+
+
+def create_engine(url: str = SQLALCHEMY_DATABASE_URL, null_pool: bool = DB_NULL_POOL) -> AsyncEngine:
+    """ Создание движка БД. С null_pool=True соединения не переиспользуются,
+        что нужно для alembic и тестов
+    """
+    connect_args = {}
+    if make_url(url).get_driver_name() == "asyncpg":
+        connect_args["prepared_statement_cache_size"] = DB_STATEMENT_CACHE_SIZE
+    if null_pool:
+        return create_async_engine(url, poolclass=NullPool, connect_args=connect_args)
+    return create_async_engine(
+        url,
+        poolclass=InstrumentedAsyncPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
+def register_pool_metrics(async_engine: AsyncEngine, prefix: str = "db_pool"):
+    """ Регистрация метрик состояния пула соединений
+    """
+    pool = async_engine.pool
+    if not isinstance(pool, AsyncAdaptedQueuePool):
+        return
+    registry.gauge(f"{prefix}_size", "Configured pool size", pool.size)
+    registry.gauge(f"{prefix}_checked_out", "Connections currently checked out", pool.checkedout)
+    registry.gauge(f"{prefix}_overflow", "Overflow connections currently open", pool.overflow)
+
+
+engine = create_engine()
+register_pool_metrics(engine)
+instrument_engine(engine)
 async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+if DB_REPLICA_URL:
+    replica_engine = create_engine(DB_REPLICA_URL)
+    register_pool_metrics(replica_engine, prefix="db_replica_pool")
+    instrument_engine(replica_engine)
+    replica_session_maker = sessionmaker(replica_engine, class_=AsyncSession, expire_on_commit=False)
+else:
+    replica_engine = None
+    replica_session_maker = async_session_maker
+
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
 
 
+def get_read_session_maker(request: Request) -> sessionmaker:
+    """ Фабрика сессий для эндпоинтов только на чтение: реплика, если она задана
+        и пользователь недавно не менял данные. Иначе основная БД
+    """
+    if READ_PRIMARY_COOKIE in request.cookies:
+        return async_session_maker
+    return replica_session_maker
+
+
+async def get_read_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """ Сессия для эндпоинтов только на чтение, см. get_read_session_maker
+    """
+    async with get_read_session_maker(request)() as session:
+        yield session
+
+
+async def run_in_session(session_maker: sessionmaker, func: Callable[[AsyncSession], Awaitable]):
+    """ Выполнение запроса в отдельной сессии со своим соединением из пула.
+        AsyncSession не поддерживает параллельные операции, поэтому для asyncio.gather
+        каждому запросу нужна своя сессия
+    """
+    async with session_maker() as session:
+        return await func(session)
+
+
 Base = declarative_base()
@@ -0,0 +1,113 @@
+""" Секционирование доходов и расходов по дате в PostgreSQL.
+    Секции называются {таблица}_pГГГГ_ММ (по месяцам) или {таблица}_pГГГГ (по годам),
+    строки вне созданных секций попадают в {таблица}_default
+"""
+import re
+
+from datetime import datetime
+from typing import List, Union
+
+
+PARTITIONED_TABLES = ("income", "expense")
+
+
+def period_start(date: datetime, interval: str) -> datetime:
+    """ Начало месяца или года, в который попадает дата
+    """
+    date = date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if interval == "year":
+        date = date.replace(month=1)
+    return date
+
+
+def next_period(start: datetime, interval: str) -> datetime:
+    """ Начало следующего месяца или года
+    """
+    if interval == "year":
+        return start.replace(year=start.year + 1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def shift_periods(date: datetime, interval: str, count: int) -> datetime:
+    """ Начало периода, отстоящего от даты на count периодов (count может быть отрицательным)
+    """
+    start = period_start(date, interval)
+    if interval == "year":
+        return start.replace(year=start.year + count)
+    months = start.year * 12 + start.month - 1 + count
+    return start.replace(year=months // 12, month=months % 12 + 1)
+
+
+def partition_name(table: str, start: datetime, interval: str) -> str:
+    return f"{table}_p{start:%Y}" if interval == "year" else f"{table}_p{start:%Y_%m}"
+
+
+def parse_partition_name(table: str, name: str) -> Union[tuple, None]:
+    """ Интервал (начало, конец) секции по ее имени, None для секций с другими именами
+    """
+    match = re.fullmatch(rf"{table}_p(\d{{4}})(?:_(\d{{2}}))?", name)
+    if not match:
+        return None
+    year, month = match.groups()
+    start = datetime(int(year), int(month or 1), 1)
+    return start, next_period(start, "month" if month else "year")
+
+
+def default_partition_statement(table: str) -> str:
+    return f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT"
+
+
+def create_partition_statements(table: str, start: datetime, interval: str) -> List[str]:
+    """ Создание секции периода. Секция создается отдельной таблицей, в нее переносятся строки
+        периода из секции по умолчанию, и только затем она присоединяется к таблице
+    """
+    name = partition_name(table, start, interval)
+    bounds = f"'{start.isoformat(' ')}'", f"'{next_period(start, interval).isoformat(' ')}'"
+    return [
+        f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)",
+        f"WITH moved AS (DELETE FROM {table}_default WHERE date >= {bounds[0]} AND date < {bounds[1]} "
+        f"RETURNING *) INSERT INTO {name} SELECT * FROM moved",
+        f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ({bounds[0]}) TO ({bounds[1]})",
+    ]
+
+
+def detach_partition_statements(table: str, name: str, archive_schema: Union[str, None]) -> List[str]:
+    """ Отсоединение секции. Секция переносится в схему архива или удаляется, если схема не задана
+    """
+    statements = [f"ALTER TABLE {table} DETACH PARTITION {name}"]
+    if archive_schema:
+        statements.append(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+        statements.append(f"ALTER TABLE {name} SET SCHEMA {archive_schema}")
+    else:
+        statements.append(f"DROP TABLE {name}")
+    return statements
+
+
+def detach_rollup_statements(
+        table: str, start: datetime, end: datetime, archive_schema: Union[str, None]
+) -> List[str]:
+    """ Месячные итоги отсоединенной секции, чтобы итоги совпадали с суммами по оставшимся записям.
+        Итоги переносятся в monthly_rollup схемы архива или удаляются, если схема не задана
+    """
+    rows = f"monthly_rollup WHERE kind = '{table}' AND month >= '{start.isoformat(' ')}' " \
+           f"AND month < '{end.isoformat(' ')}'"
+    if not archive_schema:
+        return [f"DELETE FROM {rows}"]
+    return [
+        f"CREATE TABLE IF NOT EXISTS {archive_schema}.monthly_rollup (LIKE monthly_rollup INCLUDING DEFAULTS)",
+        f"WITH moved AS (DELETE FROM {rows} RETURNING *) INSERT INTO {archive_schema}.monthly_rollup "
+        f"SELECT * FROM moved",
+    ]
+
+
+def list_partitions_query(table: str) -> str:
+    """ Имена секций таблицы
+    """
+    return (
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        f"WHERE parent.relname = '{table}'"
+    )
@@ -1,16 +1,45 @@
-from sqlalchemy import select, insert, or_
-from MyFinance.models import Expense, Income, Currency, Category, Account
-from MyFinance.schemas import CreateCategory, CreateCurrency, CreateAccount, CreateFinance
+from config import EXCHANGE_RATE_TTL
+from core.cache import cache, MemoryBackend
+from core.utils import truncate_date, month_start, get_insert, escape_like
+from collections import Counter, defaultdict
+from sqlalchemy import (
+    select, insert, update, delete, and_, or_, tuple_, literal_column, union_all, bindparam, case, cast, Numeric
+)
+from MyFinance.models import (
+    Expense, Income, Currency, Category, Account, MonthlyRollup, DataVersion, Tombstone, ExchangeRate
+)
+from MyFinance.schemas import (
+    CreateCategory, CreateCurrency, CreateAccount, CreateFinance, ImportFinance, CategorySchema, CurrencySchema,
+    AccountSchema, BatchAction, BatchOperation, ExchangeRateSchema
+)
 from datetime import datetime
+from decimal import Decimal
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
 from sqlalchemy.sql import func
-from typing import Union
+from typing import AsyncIterator, Dict, List, Union
+
+
+IMPORT_CHUNK_SIZE = 1000
+
+# Последние курсы валют в памяти процесса вместе со временем загрузки курсов, по которому они посчитаны
+rate_cache = MemoryBackend(max_size=1)
 
 
 class Base:
     """ Базовый класс обращения в БД
     """
-    def __init__(self, session):
+    # Справочники в кэше, которые сбрасываются при изменении записей
+    invalidates = ()
+
+    def __init__(self, session, pending: Union[set, None] = None):
+        """
+        :param session: Сессия БД
+        :param pending: Справочники для сброса кэша, если изменения фиксируются
+            одним commit в конце пакета (BatchEntity). Иначе commit после каждого изменения
+        """
         self.session = session
+        self.pending = pending
 
     @staticmethod
     async def _all(result):
@@ -29,16 +58,43 @@ class Base:
     def _one(result):
         return result.one()
 
-    @staticmethod
-    def _count(result):
-        return len(result)
+    async def _count(self, query) -> int:
+        """ Выполнение запроса SELECT count(*)
+        """
+        result = await self.session.execute(query)
+        return result.scalar_one()
+
+    async def _touch(self, user_id: Union[int, None]):
+        """ Увеличение версии данных пользователя в текущей транзакции.
+            Общие записи без пользователя версию не меняют
+        """
+        if user_id is None:
+            return
+        table = DataVersion.__table__
+        query = get_insert(self.session)(table).values(user_id=user_id, version=1)
+        query = query.on_conflict_do_update(
+            index_elements=[table.c.user_id],
+            set_={"version": table.c.version + 1}
+        )
+        await self.session.execute(query)
+
+    async def _commit(self, user_id: Union[int, None]):
+        """ Фиксация изменения: версия данных, commit и сброс кэша.
+            В пакете изменений только запоминаются справочники для сброса кэша
+        """
+        if self.pending is not None:
+            self.pending.update(self.invalidates)
+            return
+        await self._touch(user_id)
+        await self.session.commit()
+        await cache.invalidate(user_id, *self.invalidates)
 
     async def _add(self, obj, user_id, data):
         data = data.dict()
         data["user_id"] = user_id
         query = insert(obj).values(**data)
         await self.session.execute(query)
-        await self.session.commit()
+        await self._commit(user_id)
         return {
             "status": "success"
         }
@@ -46,14 +102,17 @@ class Base:
     async def _update(self, obj, data):
         for field, value in data.dict().items():
             setattr(obj, field, value)
-        await self.session.commit()
+        await self._commit(obj.user_id)
         return {
             "status": "success"
         }
 
     async def _delete(self, obj):
         await self.session.delete(obj)
-        await self.session.commit()
+        await self.session.execute(
+            insert(Tombstone).values(entity=obj.__tablename__, entity_id=obj.id, user_id=obj.user_id)
+        )
+        await self._commit(obj.user_id)
         return {
             "status": "success"
         }
@@ -62,49 +121,275 @@ class Base:
 class FinanceEntityBase(Base):
     """ Базобый класс обращения к БД для доходов / расходов
     """
+    # Знак изменения баланса счета: 1 для доходов, -1 для расходов
+    balance_sign = 1
+    invalidates = ("account",)
+
     async def _filter_by_date(
             self, obj, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None],
-            category_id: Union[int, None] = None
+            category_id: Union[int, None] = None, after: Union[tuple, None] = None, limit: Union[int, None] = None
     ):
         """ Фильтр доходов / расходов по датам
         :param obj: Модель расхода / дохода
         :param start_date: Начальная дата
         :param end_date: Конечныя дата
+        :param after: Ключ (date, id) последней записи предыдущей страницы
+        :param limit: Размер страницы
         :return: Ответ БД
         """
-        return await self.__get_query_with_filter_by_date(obj, user_id, start_date, end_date, category_id)
+        return await self.__get_query_with_filter_by_date(
+            obj, user_id, start_date, end_date, category_id, after, limit
+        )
 
     async def _filter_by_category_id(
             self, obj, start_date: Union[datetime, None], end_date: Union[datetime, None], user_id: int,
-            category_id: int
+            category_id: int, after: Union[tuple, None] = None, limit: Union[int, None] = None
     ) -> list:
-        """ Фильтр доходов / расходов по датам
+        """ Фильтр доходов / расходов по категории
         :param obj: Модель расхода / дохода
         :param category_id: Id категории
         :return: Ответ БД
         """
-        if start_date or end_date:
-            return await self._filter_by_date(obj, user_id, start_date, end_date, category_id)
-        query = select(Income).filter(obj.user_id == user_id).filter(obj.category_id == category_id)
-        query_result = await self.session.execute(query)
-        return await self._all(query_result)
+        return await self._filter_by_date(obj, user_id, start_date, end_date, category_id, after, limit)
 
-    async def _amount_sum(self, obj, start_date: Union[datetime, None], end_date: Union[datetime, None]):
+    async def _amount_sum(
+            self, obj, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None]
+    ):
         """ Сумма расходов / доходов
         :param obj: Модель расхода / дохода
+        :param user_id: Текущий пользователь
         :param start_date: Начальная дата
         :param end_date: Конечная дата
         :return: Ответ БД
         """
-        query = select(func.sum(obj.amount).label("total_sum")).\
-            filter(obj.date >= start_date, obj.date <= end_date).first()
+        query = select(func.coalesce(func.sum(obj.amount), 0).label("total_sum")).filter(obj.user_id == user_id)
+        if start_date:
+            query = query.filter(obj.date >= start_date)
+        if end_date:
+            query = query.filter(obj.date <= end_date)
+        result = await self.session.execute(query)
+        return result.scalar_one()
+
+    @staticmethod
+    def _count_query(
+            obj, user_id: int, start_date: Union[datetime, None] = None, end_date: Union[datetime, None] = None,
+            category_id: Union[int, None] = None
+    ):
+        """ Количество расходов / доходов без выборки записей
+        :param obj: Модель расхода / дохода
+        :param category_id: Категория, для итогов страниц списка по категории
+        :return: SQL запрос
+        """
+        query = select(func.count()).select_from(obj).filter(obj.user_id == user_id)
+        if category_id:
+            query = query.filter(obj.category_id == category_id)
+        if start_date:
+            query = query.filter(obj.date >= start_date)
+        if end_date:
+            query = query.filter(obj.date <= end_date)
+        return query
+
+    async def _update_rollup(
+            self, obj, user_id: int, date: datetime, category_id: Union[int, None], account_id: Union[int, None],
+            amount: Decimal, count: int
+    ):
+        """ Инкрементальное обновление месячных итогов в текущей транзакции
+        :param obj: Модель расхода / дохода
+        :param date: Дата дохода / расхода
+        :param amount: Изменение суммы
+        :param count: Изменение количества записей
+        """
+        await self._apply_rollups(obj, user_id, {
+            (month_start(date), category_id or 0, account_id or 0): (amount, count)
+        })
+
+    async def _apply_rollups(self, obj, user_id: int, deltas: dict):
+        """ Применение изменений месячных итогов одним executemany
+        :param obj: Модель расхода / дохода
+        :param deltas: {(месяц, id категории, id счета): (изменение суммы, изменение количества)}
+        """
+        table = MonthlyRollup.__table__
+        query = get_insert(self.session)(table)
+        query = query.on_conflict_do_update(
+            index_elements=list(table.primary_key),
+            set_={
+                "total": table.c.total + query.excluded.total,
+                "count": table.c.count + query.excluded.count
+            }
+        )
+        await self.session.execute(query, [
+            {
+                "user_id": user_id,
+                "month": month,
+                "category_id": category_id,
+                "account_id": account_id,
+                "kind": obj.__tablename__,
+                "total": total,
+                "count": count
+            }
+            for (month, category_id, account_id), (total, count) in deltas.items()
+        ])
+
+    async def _change_balance(self, user_id: int, account_id: int, delta: Decimal) -> bool:
+        """ Атомарное изменение баланса счета одним UPDATE ... RETURNING в текущей транзакции
+        :param account_id: Id счета пользователя
+        :param delta: Изменение баланса
+        :return: Найден ли счет пользователя
+        """
+        account = Account.__table__
+        query = update(account).\
+            where(account.c.id == account_id).\
+            where(account.c.user_id == user_id).\
+            values(amount=account.c.amount + delta).\
+            returning(account.c.id)
         result = await self.session.execute(query)
-        row = result.first()
-        return row[0]
+        return result.first() is not None
+
+    async def _category_exists(self, user_id: int, category_id: int) -> bool:
+        """ Категория пользователя или общая категория существует
+        """
+        query = select(Category.id).\
+            filter(or_(Category.user_id == user_id, Category.user_id == None)).\
+            filter(Category.id == category_id)
+        result = await self.session.execute(query)
+        return result.first() is not None
+
+    async def _add_finance(self, obj, user_id: int, data: CreateFinance):
+        """ Добавление дохода / расхода вместе с балансом счета и месячными итогами
+        """
+        if not await self._category_exists(user_id, data.category_id):
+            return {
+                "status": "fail",
+                "message": "Category is not found"
+            }
+        if not await self._change_balance(user_id, data.account_id, self.balance_sign * data.amount):
+            return {
+                "status": "fail",
+                "message": "Account is not found"
+            }
+        values = data.dict()
+        values["user_id"] = user_id
+        result = await self.session.execute(insert(obj).values(**values).returning(obj.date))
+        await self._update_rollup(
+            obj, user_id, result.scalar_one(), data.category_id, data.account_id, data.amount, 1
+        )
+        await self._commit(user_id)
+        return {
+            "status": "success"
+        }
+
+    async def _bulk_add_finance(self, obj, user_id: int, items: List[ImportFinance]):
+        """ Добавление списка доходов / расходов в одной транзакции: проверка счетов и категорий одним запросом,
+            вставка пачками многострочным INSERT, одно изменение баланса на счет
+        :param obj: Модель расхода / дохода
+        :param items: Доходы / расходы
+        """
+        account_ids = {item.account_id for item in items}
+        category_ids = {item.category_id for item in items}
+        query = union_all(
+            select(literal_column("'account'"), Account.id).
+            filter(Account.user_id == user_id).
+            filter(Account.id.in_(account_ids)),
+            select(literal_column("'category'"), Category.id).
+            filter(or_(Category.user_id == user_id, Category.user_id == None)).
+            filter(Category.id.in_(category_ids))
+        )
+        found = {(kind, pk) for kind, pk in (await self.session.execute(query)).all()}
+        missing_accounts = sorted(pk for pk in account_ids if ("account", pk) not in found)
+        missing_categories = sorted(pk for pk in category_ids if ("category", pk) not in found)
+        if missing_accounts or missing_categories:
+            return {
+                "status": "fail",
+                "message": f"Accounts {missing_accounts} or categories {missing_categories} are not found"
+            }
+
+        now = datetime.utcnow()
+        rows = []
+        balances = defaultdict(Decimal)
+        rollups = {}
+        for item in items:
+            row = item.dict()
+            row["date"] = item.date or now
+            row["user_id"] = user_id
+            rows.append(row)
+            balances[item.account_id] += self.balance_sign * item.amount
+            key = (month_start(row["date"]), item.category_id, item.account_id)
+            total, count = rollups.get(key, (0, 0))
+            rollups[key] = (total + item.amount, count + 1)
+
+        for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+            await self.session.execute(insert(obj.__table__).values(rows[start:start + IMPORT_CHUNK_SIZE]))
+        account = Account.__table__
+        await self.session.execute(
+            update(account).
+            where(account.c.id == bindparam("account_id")).
+            values(amount=account.c.amount + bindparam("delta")),
+            [{"account_id": pk, "delta": delta} for pk, delta in balances.items()]
+        )
+        await self._apply_rollups(obj, user_id, rollups)
+        await self._commit(user_id)
+        return {
+            "status": "success"
+        }
+
+    async def _update_finance(self, obj, instance, data: CreateFinance):
+        """ Изменение дохода / расхода вместе с балансом счетов и месячными итогами
+        """
+        if instance.category_id != data.category_id and not await self._category_exists(
+                instance.user_id, data.category_id
+        ):
+            return {
+                "status": "fail",
+                "message": "Category is not found"
+            }
+        if instance.account_id == data.account_id:
+            delta = self.balance_sign * (data.amount - instance.amount)
+            if delta:
+                await self._change_balance(instance.user_id, data.account_id, delta)
+        else:
+            if not await self._change_balance(instance.user_id, data.account_id, self.balance_sign * data.amount):
+                return {
+                    "status": "fail",
+                    "message": "Account is not found"
+                }
+            await self._change_balance(instance.user_id, instance.account_id, -self.balance_sign * instance.amount)
+        await self._update_rollup(
+            obj, instance.user_id, instance.date, instance.category_id, instance.account_id, -instance.amount, -1
+        )
+        await self._update_rollup(
+            obj, instance.user_id, instance.date, data.category_id, data.account_id, data.amount, 1
+        )
+        return await self._update(instance, data)
+
+    async def _delete_finance(self, obj, instance):
+        """ Удаление дохода / расхода вместе с балансом счета и месячными итогами
+        """
+        await self._change_balance(instance.user_id, instance.account_id, -self.balance_sign * instance.amount)
+        await self._update_rollup(
+            obj, instance.user_id, instance.date, instance.category_id, instance.account_id, -instance.amount, -1
+        )
+        return await self._delete(instance)
+
+    @staticmethod
+    def _paginate(query, obj, after: Union[tuple, None], limit: Union[int, None]):
+        """ Keyset пагинация по (date, id) от новых записей к старым.
+            Выбирается limit + 1 запись, чтобы понять, есть ли следующая страница
+        :param query: SQL запрос
+        :param obj: Модель расхода / дохода
+        :param after: Ключ (date, id) последней записи предыдущей страницы
+        :param limit: Размер страницы
+        :return: SQL запрос
+        """
+        query = query.order_by(obj.date.desc(), obj.id.desc())
+        if after:
+            query = query.filter(tuple_(obj.date, obj.id) < tuple_(*after))
+        if limit:
+            query = query.limit(limit + 1)
+        return query
 
     async def __get_query_with_filter_by_date(
             self, obj, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None],
-            category_id: Union[int, None]
+            category_id: Union[int, None], after: Union[tuple, None], limit: Union[int, None]
     ):
         """ Добавление фильтра по датам в запрос
         :param obj: Модель расхода / дохода
@@ -113,44 +398,97 @@ class FinanceEntityBase(Base):
         :param end_date: Конечныя дата
         :return: SQL запрос
         """
-        query = select(obj).filter(obj.user_id == user_id)
+        query = self._select_finance_columns(obj).filter(obj.user_id == user_id)
         if category_id:
             query = query.filter(obj.category_id == category_id)
         if start_date:
             query = query.filter(obj.date >= start_date)
         if end_date:
             query = query.filter(obj.date <= end_date)
+        query = self._paginate(query, obj, after, limit)
 
         result = await self.session.execute(query)
-        row = result.all()
+        return [self._finance_item(row) for row in result.all()]
 
-        return [data[0] for data in row]
+    @staticmethod
+    def _select_finance_columns(obj):
+        """ Только нужные для списка колонки дохода / расхода, категории, счета и валюты
+            без построения ORM объектов
+        :param obj: Модель расхода / дохода
+        :return: SQL запрос
+        """
+        return select(
+            obj.id,
+            obj.title,
+            obj.amount,
+            obj.date,
+            obj.category_id,
+            Category.name.label("category_name"),
+            Category.category_type,
+            obj.account_id,
+            Account.name.label("account_name"),
+            Account.amount.label("account_amount"),
+            Account.add_to_balance,
+            Account.updated_at,
+            Account.currency_id,
+            Currency.name.label("currency_name")
+        ).\
+            outerjoin(Category, Category.id == obj.category_id).\
+            outerjoin(Account, Account.id == obj.account_id).\
+            outerjoin(Currency, Currency.id == Account.currency_id)
+
+    @staticmethod
+    def _finance_item(row) -> dict:
+        """ Строка запроса в структуре BaseFinanceSchema
+        """
+        return {
+            "id": row.id,
+            "title": row.title,
+            "amount": row.amount,
+            "date": row.date,
+            "category": {
+                "id": row.category_id,
+                "name": row.category_name,
+                "category_type": row.category_type
+            },
+            "account": {
+                "id": row.account_id,
+                "name": row.account_name,
+                "amount": row.account_amount,
+                "add_to_balance": row.add_to_balance,
+                "updated_at": row.updated_at,
+                "currency": {
+                    "id": row.currency_id,
+                    "name": row.currency_name
+                }
+            }
+        }
 
 
 class IncomeEntity(FinanceEntityBase):
     """Обращение к БД доходов """
-    async def get_income_list(self, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None]):
-        if start_date or end_date:
-            return await self._filter_by_date(Income, user_id, start_date, end_date)
-        query = select(Income).filter(Income.user_id == user_id)
-        query_result = await self.session.execute(query)
-        return await self._all(query_result)
+    balance_sign = 1
+
+    async def get_income_list(
+            self, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None],
+            after: Union[tuple, None] = None, limit: Union[int, None] = None
+    ):
+        return await self._filter_by_date(Income, user_id, start_date, end_date, after=after, limit=limit)
 
-    async def get_income_sum(self, start_date: datetime, end_date: datetime):
-        return await self._amount_sum(Income, start_date, end_date)
+    async def get_income_sum(self, user_id: int, start_date: datetime, end_date: datetime):
+        return await self._amount_sum(Income, user_id, start_date, end_date)
+
+    async def get_income_count(
+            self, user_id: int, start_date: Union[datetime, None] = None, end_date: Union[datetime, None] = None,
+            category_id: Union[int, None] = None
+    ) -> int:
+        return await self._count(self._count_query(Income, user_id, start_date, end_date, category_id))
 
     async def create(self, data: CreateFinance, user_id: int):
-        income = Income(**data.dict())
-        query = select(Account).filter(Account.id == income.account_id).filter(Account.user_id == user_id)
-        result = await self.session.execute(query)
-        account = self._first(result=result)
-        if not account:
-            return {
-                "status": "fail",
-                "message": "Income is not found"
-            }
-        account.amount += income.amount
-        return await self._add(obj=Income, user_id=user_id, data=data)
+        return await self._add_finance(obj=Income, user_id=user_id, data=data)
+
+    async def bulk_create(self, items: List[ImportFinance], user_id: int):
+        return await self._bulk_add_finance(Income, user_id, items)
 
     async def update(self, pk: int, data: CreateFinance, user_id: int):
         income = await self.session.get(Income, pk)
@@ -159,58 +497,59 @@ class IncomeEntity(FinanceEntityBase):
                 "status": "fail",
                 "message": "Income is not found"
             }
-        return await self._update(income, data)
+        return await self._update_finance(Income, income, data)
 
     async def delete(self, pk: int, user_id: int):
         income = await self.session.get(Income, pk)
-        query = select(Account).filter(Account.id == income.account_id).filter(Account.user_id == user_id)
-        result = await self.session.execute(query)
-        account = self._first(result=result)
         if not income or income.user_id != user_id:
             return {
                 "status": "fail",
                 "message": "Income is not found"
             }
-        account.amount -= income.amount
-        return await self._delete(income)
+        return await self._delete_finance(Income, income)
 
     async def get_income_by_id(self, pk: int, user_id: int):
-        query = select(Income).filter(Income.user_id == user_id).filter(Income.id == int(pk))
+        query = select(Income).\
+            options(joinedload(Income.category), joinedload(Income.account).joinedload(Account.currency)).\
+            filter(Income.user_id == user_id).\
+            filter(Income.id == int(pk))
         result = await self.session.execute(query)
         return self._first(result)
 
     async def get_income_list_by_category(
-            self, category_id: int, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None]
+            self, category_id: int, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None],
+            after: Union[tuple, None] = None, limit: Union[int, None] = None
     ) -> list:
         return await self._filter_by_category_id(
-            obj=Income, start_date=start_date, end_date=end_date, user_id=user_id, category_id=category_id
+            obj=Income, start_date=start_date, end_date=end_date, user_id=user_id, category_id=category_id,
+            after=after, limit=limit
         )
 
 
 class ExpenseEntity(FinanceEntityBase):
     """ Обращение к БД расходов """
-    async def get_expense_list(self, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None]):
-        if start_date or end_date:
-            return await self._filter_by_date(Expense, user_id, start_date, end_date)
-        query = select(Expense).filter(Expense.user_id == user_id)
-        query_result = await self.session.execute(query)
-        return await self._all(query_result)
+    balance_sign = -1
 
-    async def get_expense_sum(self, start_date: datetime, end_date: datetime):
-        return await self._amount_sum(Expense, start_date, end_date)
+    async def get_expense_list(
+            self, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None],
+            after: Union[tuple, None] = None, limit: Union[int, None] = None
+    ):
+        return await self._filter_by_date(Expense, user_id, start_date, end_date, after=after, limit=limit)
+
+    async def get_expense_sum(self, user_id: int, start_date: datetime, end_date: datetime):
+        return await self._amount_sum(Expense, user_id, start_date, end_date)
+
+    async def get_expense_count(
+            self, user_id: int, start_date: Union[datetime, None] = None, end_date: Union[datetime, None] = None,
+            category_id: Union[int, None] = None
+    ) -> int:
+        return await self._count(self._count_query(Expense, user_id, start_date, end_date, category_id))
 
     async def create(self, data: CreateFinance, user_id: int):
-        expense = Expense(**data.dict())
-        query = select(Account).filter(Account.id == expense.account_id).filter(Account.user_id == user_id)
-        result = await self.session.execute(query)
-        account = self._first(result=result)
-        if not account:
-            return {
-                "status": "fail",
-                "message": "Expense is not found"
-            }
-        account.amount += expense.amount
-        return await self._add(obj=Expense, user_id=user_id, data=data)
+        return await self._add_finance(obj=Expense, user_id=user_id, data=data)
+
+    async def bulk_create(self, items: List[ImportFinance], user_id: int):
+        return await self._bulk_add_finance(Expense, user_id, items)
 
     async def update(self, pk: int, data: CreateFinance, user_id: int):
         expense = await self.session.get(Expense, pk)
@@ -219,7 +558,7 @@ class ExpenseEntity(FinanceEntityBase):
                 "status": "fail",
                 "message": "Expense is not found"
             }
-        return await self._update(expense, data)
+        return await self._update_finance(Expense, expense, data)
 
     async def delete(self, pk: int, user_id: int):
         expense = await self.session.get(Expense, pk)
@@ -228,27 +567,131 @@ class ExpenseEntity(FinanceEntityBase):
                 "status": "fail",
                 "message": "Expense is not found"
             }
-        return await self._delete(expense)
+        return await self._delete_finance(Expense, expense)
 
     async def get_expense_by_id(self, pk: int, user_id: int):
-        query = select(Expense).filter(Income.user_id == user_id).filter(Expense.id == int(pk))
+        query = select(Expense).\
+            options(joinedload(Expense.category), joinedload(Expense.account).joinedload(Account.currency)).\
+            filter(Expense.user_id == user_id).\
+            filter(Expense.id == int(pk))
         result = await self.session.execute(query)
         return self._first(result)
 
     async def get_expense_list_by_category(
-            self, category_id: int, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None]
+            self, category_id: int, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None],
+            after: Union[tuple, None] = None, limit: Union[int, None] = None
     ) -> list:
         return await self._filter_by_category_id(
-            obj=Expense, start_date=start_date, end_date=end_date, user_id=user_id, category_id=category_id
+            obj=Expense, start_date=start_date, end_date=end_date, user_id=user_id, category_id=category_id,
+            after=after, limit=limit
+        )
+
+
+class TransactionEntity(FinanceEntityBase):
+    """Лента доходов и расходов вместе и поиск по ней """
+    models = {"income": Income, "expense": Expense}
+
+    def _match(self, obj, text: str):
+        """ Условие поиска: подстрока без учета регистра, в PostgreSQL еще и нечеткое совпадение слова.
+            Оба условия используют триграммный индекс по title
+        :param obj: Модель расхода / дохода
+        :param text: Строка поиска
+        """
+        condition = obj.title.ilike(f"%{escape_like(text)}%", escape="\\")
+        if self.session.bind.dialect.name == "postgresql":
+            condition = or_(condition, obj.title.op("%>")(text))
+        return condition
+
+    def _page_query(
+            self, kind: str, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None],
+            category_id: Union[int, None], after: Union[tuple, None], limit: int, text: Union[str, None]
+    ):
+        """ Страница доходов или расходов по ключу (date, kind, id)
+        :param kind: income или expense
+        :param after: Ключ (date, id, kind) последней записи предыдущей страницы
+        :param text: Строка поиска
+        :return: Подзапрос
+        """
+        obj = self.models[kind]
+        query = self._select_finance_columns(obj).\
+            add_columns(literal_column(f"'{kind}'").label("kind")).\
+            filter(obj.user_id == user_id)
+        if text:
+            query = query.filter(self._match(obj, text))
+        if category_id:
+            query = query.filter(obj.category_id == category_id)
+        if start_date:
+            query = query.filter(obj.date >= start_date)
+        if end_date:
+            query = query.filter(obj.date <= end_date)
+        if after:
+            # kind у всех строк запроса одинаковый, поэтому сравнение по нему делается заранее
+            date, pk, after_kind = after
+            if kind < after_kind:
+                query = query.filter(obj.date <= date)
+            elif kind == after_kind:
+                query = query.filter(tuple_(obj.date, obj.id) < tuple_(date, pk))
+            else:
+                query = query.filter(obj.date < date)
+        return query.order_by(obj.date.desc(), obj.id.desc()).limit(limit + 1).subquery()
+
+    async def get_transactions(
+            self, user_id: int, kind: Union[str, None], start_date: Union[datetime, None],
+            end_date: Union[datetime, None], category_id: Union[int, None], after: Union[tuple, None], limit: int,
+            text: Union[str, None] = None
+    ) -> list:
+        """ Доходы и расходы одним UNION ALL запросом от новых записей к старым.
+            Каждая таблица отдает по индексу (user_id, date, id) не больше limit + 1 строки,
+            затем страницы объединяются
+        :param user_id: Текущий пользователь
+        :param kind: income, expense или None для обоих
+        :param start_date: Начальная дата
+        :param end_date: Конечная дата
+        :param category_id: Id категории
+        :param after: Ключ (date, id, kind) последней записи предыдущей страницы
+        :param limit: Размер страницы
+        :param text: Строка поиска по названию
+        :return: Записи в структуре TransactionSchema
+        """
+        kinds = [kind] if kind else list(self.models)
+        rows = union_all(*(
+            select(self._page_query(item, user_id, start_date, end_date, category_id, after, limit, text))
+            for item in kinds
+        )).subquery()
+        query = select(rows).order_by(rows.c.date.desc(), rows.c.kind.desc(), rows.c.id.desc()).limit(limit + 1)
+        result = await self.session.execute(query)
+        return [dict(self._finance_item(row), kind=row.kind) for row in result.all()]
+
+    async def search(
+            self, user_id: int, text: str, kind: Union[str, None], start_date: Union[datetime, None],
+            end_date: Union[datetime, None], category_id: Union[int, None], after: Union[tuple, None], limit: int
+    ) -> list:
+        """ Поиск доходов и расходов по названию в ленте
+        """
+        return await self.get_transactions(
+            user_id, kind, start_date, end_date, category_id, after, limit, text=text
         )
 
 
 class CurrencyEntity(Base):
     """Обращение к БД валют """
+    invalidates = ("currency", "account")
+
     async def get_currency_list(self, user_id: int):
+        return await cache.get_or_set("currency", user_id, lambda: self._get_currency_list(user_id))
+
+    async def _get_currency_list(self, user_id: int):
         query = select(Currency).filter(or_(Currency.user_id == user_id, Currency.user_id == None))
         query_result = await self.session.execute(query)
-        return await self._all(query_result)
+        return [CurrencySchema.from_orm(currency).dict() for currency in await self._all(query_result)]
+
+    @staticmethod
+    def _count_query(user_id: int):
+        return select(func.count()).select_from(Currency).\
+            filter(or_(Currency.user_id == user_id, Currency.user_id == None))
+
+    async def get_currency_count(self, user_id: int):
+        return await self._count(self._count_query(user_id))
 
     async def create(self, user_id: int, data: CreateCurrency):
         return await self._add(obj=Currency, user_id=user_id, data=data)
@@ -279,16 +722,23 @@ class CurrencyEntity(Base):
 
 class CategoryEntity(Base):
     """Обращение к БД категорий """
+    invalidates = ("category",)
+
     async def get_category_list(self, user_id: int):
+        return await cache.get_or_set("category", user_id, lambda: self._get_category_list(user_id))
+
+    async def _get_category_list(self, user_id: int):
         query = select(Category).filter(or_(Category.user_id == user_id, Category.user_id == None))
         query_result = await self.session.execute(query)
-        return await self._all(query_result)
+        return [CategorySchema.from_orm(category).dict() for category in await self._all(query_result)]
+
+    @staticmethod
+    def _count_query(user_id: int):
+        return select(func.count()).select_from(Category).\
+            filter(or_(Category.user_id == user_id, Category.user_id == None))
 
     async def get_category_count(self, user_id: int):
-        query = select(Category).filter(or_(Category.user_id == user_id, Category.user_id == None))
-        query_result = await self.session.execute(query)
-        result = await self._all(query_result)
-        return self._count(result)
+        return await self._count(self._count_query(user_id))
 
     async def create(self, user_id: int, data: CreateCategory):
         return await self._add(obj=Category, user_id=user_id, data=data)
@@ -321,16 +771,24 @@ class CategoryEntity(Base):
 
 class AccountEntity(Base):
     """Обращение к БД счетов """
-    async def get_account_list(self, user_id: int):
-        query = select(Account).filter(Account.user_id == user_id)
-        query_result = await self.session.execute(query)
-        return await self._all(query_result)
+    invalidates = ("account",)
 
-    async def det_account_count(self, user_id: int):
-        query = select(Account).filter(Account.user_id == user_id)
+    async def get_account_list(self, user_id: int, version: Union[str, None] = None):
+        return await cache.get_or_set(
+            "account", user_id, lambda: self._get_account_list(user_id), version=version
+        )
+
+    async def _get_account_list(self, user_id: int):
+        query = select(Account).options(joinedload(Account.currency)).filter(Account.user_id == user_id)
         query_result = await self.session.execute(query)
-        result = self._all(query_result)
-        return await self._count(result)
+        return [AccountSchema.from_orm(account).dict() for account in await self._all(query_result)]
+
+    @staticmethod
+    def _count_query(user_id: int):
+        return select(func.count()).select_from(Account).filter(Account.user_id == user_id)
+
+    async def get_account_count(self, user_id: int):
+        return await self._count(self._count_query(user_id))
 
     async def create(self, data: CreateAccount, user_id: int):
         return await self._add(obj=Account, user_id=user_id, data=data)
@@ -354,16 +812,523 @@ class AccountEntity(Base):
         return await self._delete(account)
 
     async def get_account_by_id(self, pk: int, user_id: int):
-        query = select(Account).filter(Account.user_id == user_id).filter(Account.id == int(pk))
+        query = select(Account).\
+            options(joinedload(Account.currency)).\
+            filter(Account.user_id == user_id).\
+            filter(Account.id == int(pk))
         result = await self.session.execute(query)
         return self._first(result)
 
-    async def get_account_sum(self, user_id: int):
-        query = select(Currency.name, func.sum(Account.amount).label("total")).\
+    async def get_account_sum(self, user_id: int, currency: Union[str, None] = None):
+        """ Балансы счетов по валютам
+        :param user_id: Текущий пользователь
+        :param currency: Валюта, в которую пересчитываются балансы. Балансы в валютах без курса
+            остаются в своей валюте
+        :return: Ответ БД
+        """
+        if currency:
+            rates = await ExchangeRateEntity(self.session).get_rates(currency)
+            columns = ExchangeRateEntity.convert(Account.amount, Currency.name, currency, rates)
+        else:
+            columns = (Currency.name.label("currency"), Account.amount)
+        rows = select(*columns).\
+            select_from(Account).\
             join(Account.currency).\
             filter(Account.add_to_balance).\
             filter(Account.user_id == user_id).\
-            group_by(Currency.name)
+            subquery()
+        query = select(rows.c.currency, cast(func.sum(rows.c.amount), Numeric(18, 2)).label("total")).\
+            group_by(rows.c.currency)
         result = await self.session.execute(query)
         row = result.all()
         return [{data[0]: data[1]} for data in row]
+
+
+class BatchEntity(Base):
+    """Обращение к БД для пакета изменений в одной транзакции """
+    entities = {
+        "income": (IncomeEntity, Income),
+        "expense": (ExpenseEntity, Expense),
+        "account": (AccountEntity, Account),
+        "category": (CategoryEntity, Category),
+        "currency": (CurrencyEntity, Currency),
+    }
+
+    async def _load(self, user_id: int, operations: List[BatchOperation]) -> list:
+        """ Загрузка изменяемых записей одним IN запросом на таблицу. Записи попадают
+            в identity map сессии, поэтому session.get в сущностях не обращается к БД
+        :return: Загруженные записи, ссылки держатся до конца пакета
+        """
+        ids = defaultdict(set)
+        for operation in operations:
+            if operation.id is not None:
+                ids[operation.entity.value].add(operation.id)
+        loaded = []
+        for name, pks in ids.items():
+            obj = self.entities[name][1]
+            query = select(obj).filter(obj.user_id == user_id).filter(obj.id.in_(pks))
+            loaded.extend((await self.session.execute(query)).scalars().all())
+        return loaded
+
+    @staticmethod
+    async def _apply_operation(entity, user_id: int, operation: BatchOperation) -> dict:
+        if operation.action == BatchAction.create:
+            return await entity.create(data=operation.data, user_id=user_id)
+        if operation.action == BatchAction.update:
+            return await entity.update(pk=operation.id, data=operation.data, user_id=user_id)
+        return await entity.delete(pk=operation.id, user_id=user_id)
+
+    async def apply(self, user_id: int, operations: List[BatchOperation]) -> List[dict]:
+        """ Выполнение операций в одной транзакции с одним commit в конце.
+            Каждая операция выполняется в своей точке сохранения, поэтому неудачная операция
+            откатывается целиком и не отменяет остальные
+        :param user_id: Текущий пользователь
+        :param operations: Операции создания / изменения / удаления
+        :return: Результат по каждой операции
+        """
+        # Ссылки держат загруженные записи в identity map сессии до конца пакета
+        self.loaded = await self._load(user_id, operations)
+        pending = set()
+        results = []
+        for operation in operations:
+            entity = self.entities[operation.entity.value][0](self.session, pending=pending)
+            try:
+                async with self.session.begin_nested() as savepoint:
+                    result = await self._apply_operation(entity, user_id, operation)
+                    if result["status"] != "success":
+                        await savepoint.rollback()
+            except SQLAlchemyError:
+                result = {
+                    "status": "fail",
+                    "message": "Operation is rejected by the database"
+                }
+            results.append(result)
+
+        if any(result["status"] == "success" for result in results):
+            await self._touch(user_id)
+            await self.session.commit()
+            await cache.invalidate(user_id, *pending)
+        return results
+
+
+class CountsEntity(Base):
+    """Количество записей пользователя по сущностям """
+    finance = {"income": Income, "expense": Expense}
+    references = {"account": AccountEntity, "category": CategoryEntity, "currency": CurrencyEntity}
+
+    async def get_count(
+            self, entity: str, user_id: int, start_date: Union[datetime, None] = None,
+            end_date: Union[datetime, None] = None, category_id: Union[int, None] = None
+    ) -> int:
+        """ Количество записей одной сущности. Даты и категория применяются к доходам / расходам
+        """
+        if entity in self.finance:
+            query = FinanceEntityBase._count_query(self.finance[entity], user_id, start_date, end_date, category_id)
+        else:
+            query = self.references[entity]._count_query(user_id)
+        return await self._count(query)
+
+    async def get_counts(
+            self, user_id: int, start_date: Union[datetime, None] = None, end_date: Union[datetime, None] = None
+    ) -> dict:
+        """ Все количества одним запросом из скалярных подзапросов
+        :param start_date: Начальная дата для доходов / расходов
+        :param end_date: Конечная дата для доходов / расходов
+        """
+        query = select(
+            FinanceEntityBase._count_query(Income, user_id, start_date, end_date).scalar_subquery().label("income"),
+            FinanceEntityBase._count_query(Expense, user_id, start_date, end_date).scalar_subquery().label("expense"),
+            AccountEntity._count_query(user_id).scalar_subquery().label("account"),
+            CategoryEntity._count_query(user_id).scalar_subquery().label("category"),
+            CurrencyEntity._count_query(user_id).scalar_subquery().label("currency")
+        )
+        result = await self.session.execute(query)
+        return dict(result.one()._mapping)
+
+
+class DataVersionEntity(Base):
+    """Обращение к БД версий данных пользователей """
+
+    async def get_version(self, user_id: int) -> int:
+        query = select(DataVersion.version).filter(DataVersion.user_id == user_id)
+        result = await self.session.execute(query)
+        return result.scalar() or 0
+
+
+class SyncEntity(Base):
+    """Обращение к БД для синхронизации клиентов """
+
+    @staticmethod
+    def _sync_columns() -> dict:
+        """ Колонки, которые получает клиент, по сущностям
+        """
+        return {
+            "income": (
+                Income, Income.id, Income.title, Income.amount, Income.date, Income.category_id,
+                Income.account_id, Income.updated_at
+            ),
+            "expense": (
+                Expense, Expense.id, Expense.title, Expense.amount, Expense.date, Expense.category_id,
+                Expense.account_id, Expense.updated_at
+            ),
+            "account": (
+                Account, Account.id, Account.name, Account.amount, Account.add_to_balance, Account.currency_id,
+                Account.updated_at
+            ),
+            "category": (Category, Category.id, Category.name, Category.category_type, Category.updated_at),
+            "currency": (Currency, Currency.id, Currency.name, Currency.updated_at),
+        }
+
+    async def get_changes(self, user_id: int, since: Union[datetime, None]) -> dict:
+        """ Записи, измененные или удаленные начиная с since. Без since - все записи пользователя
+        :param user_id: Текущий пользователь
+        :param since: Отметка предыдущей синхронизации клиента
+        :return: Записи по сущностям и удаленные записи
+        """
+        changes = {}
+        for name, (obj, *columns) in self._sync_columns().items():
+            query = select(*columns)
+            if obj in (Category, Currency):
+                query = query.filter(or_(obj.user_id == user_id, obj.user_id == None))
+            else:
+                query = query.filter(obj.user_id == user_id)
+            if since:
+                query = query.filter(obj.updated_at >= since)
+            result = await self.session.execute(query.order_by(obj.updated_at, obj.id))
+            changes[name] = [dict(row._mapping) for row in result.all()]
+
+        deleted = []
+        if since:
+            query = select(Tombstone.entity, Tombstone.entity_id.label("id"), Tombstone.deleted_at).\
+                filter(Tombstone.user_id == user_id).\
+                filter(Tombstone.deleted_at >= since).\
+                order_by(Tombstone.deleted_at, Tombstone.id)
+            result = await self.session.execute(query)
+            deleted = [dict(row._mapping) for row in result.all()]
+        changes["deleted"] = deleted
+        return changes
+
+
+class SummaryEntity(Base):
+    """Агрегаты доходов и расходов """
+    @staticmethod
+    def _summary_rows(
+            obj, kind: str, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None],
+            with_currency: bool, currency: Union[str, None] = None, rates: Union[Dict[str, Decimal], None] = None
+    ):
+        """ Строки доходов / расходов пользователя за период для агрегации
+        :param obj: Модель расхода / дохода
+        :param kind: income или expense
+        :param with_currency: Нужна ли валюта счета
+        :param currency: Валюта, в которую пересчитываются суммы
+        :param rates: Курсы пересчета в currency
+        :return: SQL запрос
+        """
+        columns = [literal_column(f"'{kind}'").label("kind"), obj.date, obj.category_id, obj.account_id]
+        if currency:
+            columns.extend(ExchangeRateEntity.convert(obj.amount, Currency.name, currency, rates))
+        else:
+            columns.append(obj.amount)
+        query = select(*columns).select_from(obj).filter(obj.user_id == user_id)
+        if with_currency or currency:
+            query = query.add_columns(Account.currency_id).outerjoin(Account, Account.id == obj.account_id)
+        if currency:
+            query = query.outerjoin(Currency, Currency.id == Account.currency_id)
+        if start_date:
+            query = query.filter(obj.date >= start_date)
+        if end_date:
+            query = query.filter(obj.date <= end_date)
+        return query
+
+    @staticmethod
+    def _totals_query(rows, period_column, group_by: List[str], currency: Union[str, None]):
+        """ Итоги по группам из подзапроса строк с колонками kind, category_id, account_id,
+            currency_id, amount, count и currency при пересчете
+        :param rows: Подзапрос строк
+        :param period_column: Колонка периода или None
+        :param group_by: Группировка: category, account, currency
+        :param currency: Валюта, в которую пересчитаны суммы
+        :return: SQL запрос
+        """
+        columns = [rows.c.kind]
+        if period_column is not None:
+            columns.append(period_column.label("period"))
+        for group in ("category", "account"):
+            if group in group_by:
+                columns.append(rows.c[f"{group}_id"])
+        if currency:
+            # При пересчете группировка по валюте идет по валюте после пересчета, а не по валюте счета
+            columns.append(rows.c.currency)
+        elif "currency" in group_by:
+            columns.append(rows.c.currency_id)
+
+        total = func.sum(rows.c.amount)
+        if currency:
+            # Пересчитанные суммы округляются до копеек после суммирования
+            total = cast(total, Numeric(18, 2))
+        count = func.sum(rows.c.count) if "count" in rows.c else func.count()
+        return select(*columns, total.label("total"), count.label("count")).\
+            group_by(*columns).\
+            order_by(*columns)
+
+    async def get_summary(
+            self, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None],
+            group_by: List[str], period: Union[str, None], currency: Union[str, None] = None
+    ) -> List[dict]:
+        """ Суммы доходов и расходов одним GROUP BY запросом
+        :param user_id: Текущий пользователь
+        :param start_date: Начальная дата
+        :param end_date: Конечная дата
+        :param group_by: Группировка: category, account, currency
+        :param period: Период: day, week, month
+        :param currency: Валюта, в которую пересчитываются суммы
+        :return: Строки с итогами по группам
+        """
+        if period in (None, "month") and RollupEntity.covers(start_date, end_date):
+            return await RollupEntity(self.session).get_summary(user_id, start_date, group_by, period, currency)
+
+        rates = await ExchangeRateEntity(self.session).get_rates(currency) if currency else None
+        with_currency = "currency" in group_by
+        rows = union_all(
+            self._summary_rows(Income, "income", user_id, start_date, end_date, with_currency, currency, rates),
+            self._summary_rows(Expense, "expense", user_id, start_date, end_date, with_currency, currency, rates),
+        ).subquery()
+
+        period_column = truncate_date(period, rows.c.date) if period else None
+        query = self._totals_query(rows, period_column, group_by, currency)
+        result = await self.session.execute(query)
+        return [dict(row._mapping) for row in result.all()]
+
+
+class RollupEntity(Base):
+    """Обращение к БД месячных итогов """
+    @staticmethod
+    def covers(start_date: Union[datetime, None], end_date: Union[datetime, None]) -> bool:
+        """ Итоги можно взять из месячных сумм, если период начинается с начала месяца и не ограничен сверху
+        """
+        return end_date is None and (start_date is None or start_date == month_start(start_date))
+
+    async def get_summary(
+            self, user_id: int, start_date: Union[datetime, None], group_by: List[str], period: Union[str, None],
+            currency: Union[str, None] = None
+    ) -> List[dict]:
+        """ Суммы доходов и расходов по месячным итогам
+        :param user_id: Текущий пользователь
+        :param start_date: Начало месяца, с которого считаются итоги
+        :param group_by: Группировка: category, account, currency
+        :param period: None или month
+        :param currency: Валюта, в которую пересчитываются суммы
+        :return: Строки с итогами по группам
+        """
+        # В итогах записи без категории / счета хранятся с 0, в ответе они null, как и при подсчете по записям
+        columns = [
+            MonthlyRollup.kind, MonthlyRollup.month,
+            func.nullif(MonthlyRollup.category_id, 0).label("category_id"),
+            func.nullif(MonthlyRollup.account_id, 0).label("account_id"),
+            MonthlyRollup.count
+        ]
+        if currency:
+            rates = await ExchangeRateEntity(self.session).get_rates(currency)
+            columns.extend(ExchangeRateEntity.convert(MonthlyRollup.total, Currency.name, currency, rates))
+        else:
+            columns.append(MonthlyRollup.total.label("amount"))
+        query = select(*columns).\
+            select_from(MonthlyRollup).\
+            filter(MonthlyRollup.user_id == user_id).\
+            filter(MonthlyRollup.count > 0)
+        if "currency" in group_by or currency:
+            query = query.add_columns(Account.currency_id).outerjoin(Account, Account.id == MonthlyRollup.account_id)
+        if currency:
+            query = query.outerjoin(Currency, Currency.id == Account.currency_id)
+        if start_date:
+            query = query.filter(MonthlyRollup.month >= start_date)
+        rows = query.subquery()
+
+        period_column = rows.c.month if period else None
+        query = SummaryEntity._totals_query(rows, period_column, group_by, currency)
+        result = await self.session.execute(query)
+        return [dict(row._mapping) for row in result.all()]
+
+    @staticmethod
+    def _rollup_rows(obj, user_ids: List[int]):
+        """ Месячные итоги доходов / расходов пользователей, посчитанные по исходным записям
+        """
+        month = truncate_date("month", obj.date)
+        category_id = func.coalesce(obj.category_id, 0)
+        account_id = func.coalesce(obj.account_id, 0)
+        return select(
+            obj.user_id, month, category_id, account_id, literal_column(f"'{obj.__tablename__}'"),
+            func.sum(obj.amount), func.count()
+        ).filter(obj.user_id.in_(user_ids)).group_by(obj.user_id, month, category_id, account_id)
+
+    async def rebuild(self, user_ids: List[int]):
+        """ Пересчет месячных итогов пользователей в одной транзакции
+        :param user_ids: Пользователи, итоги которых пересчитываются
+        """
+        columns = ["user_id", "month", "category_id", "account_id", "kind", "total", "count"]
+        await self.session.execute(delete(MonthlyRollup).filter(MonthlyRollup.user_id.in_(user_ids)))
+        for obj in (Income, Expense):
+            query = insert(MonthlyRollup).from_select(columns, self._rollup_rows(obj, user_ids))
+            await self.session.execute(query)
+        await self.session.commit()
+
+
+class ExchangeRateEntity(Base):
+    """Курсы валют для пересчета сумм в выбранную валюту """
+    cache_key = "latest"
+
+    async def load(self, rates: List[ExchangeRateSchema]) -> int:
+        """ Загрузка курсов пачками, курс на ту же дату заменяется.
+            Новое время загрузки сбрасывает кэш курсов во всех процессах, а версия данных
+            всех пользователей увеличивается в той же транзакции, чтобы сменился ETag ответов с пересчетом
+        :param rates: Курсы валют
+        :return: Количество загруженных курсов
+        """
+        table = ExchangeRate.__table__
+        loaded_at = datetime.utcnow()
+        rows = list({
+            (rate.base, rate.quote, rate.date): dict(rate.dict(), loaded_at=loaded_at) for rate in rates
+        }.values())
+        for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+            query = get_insert(self.session)(table).values(rows[start:start + IMPORT_CHUNK_SIZE])
+            query = query.on_conflict_do_update(
+                index_elements=[table.c.base, table.c.quote, table.c.date],
+                set_={"rate": query.excluded.rate, "loaded_at": query.excluded.loaded_at}
+            )
+            await self.session.execute(query)
+        await self.session.execute(update(DataVersion).values(version=DataVersion.version + 1))
+        await self.session.commit()
+        return len(rows)
+
+    async def _get_loaded_at(self) -> Union[datetime, None]:
+        """ Время последней загрузки курсов, max по индексу
+        """
+        result = await self.session.execute(select(func.max(ExchangeRate.loaded_at)))
+        return result.scalar_one()
+
+    async def _get_latest_rates(self) -> list:
+        """ Последний курс для каждой пары валют
+        """
+        latest = select(
+            ExchangeRate.base, ExchangeRate.quote, func.max(ExchangeRate.date).label("date")
+        ).group_by(ExchangeRate.base, ExchangeRate.quote).subquery()
+        query = select(ExchangeRate.base, ExchangeRate.quote, ExchangeRate.rate).join(
+            latest,
+            and_(
+                ExchangeRate.base == latest.c.base,
+                ExchangeRate.quote == latest.c.quote,
+                ExchangeRate.date == latest.c.date
+            )
+        )
+        result = await self.session.execute(query)
+        return result.all()
+
+    @staticmethod
+    def _rate_vector(pairs: list) -> Dict[str, Decimal]:
+        """ Матрица курсов в виде курсов всех валют к одной опорной валюте (самой частой base).
+            Курс любой пары считается как отношение их курсов к опорной валюте
+        :param pairs: Строки (base, quote, rate)
+        :return: Сколько единиц валюты стоит одна единица опорной валюты
+        """
+        if not pairs:
+            return {}
+        pivot = Counter(base for base, _, _ in pairs).most_common(1)[0][0]
+        vector = {pivot: Decimal(1)}
+        while pairs:
+            rest = []
+            for base, quote, rate in pairs:
+                if base in vector and quote not in vector:
+                    vector[quote] = vector[base] * rate
+                elif quote in vector and base not in vector:
+                    vector[base] = vector[quote] / rate
+                elif base not in vector:
+                    rest.append((base, quote, rate))
+            if len(rest) == len(pairs):
+                break
+            pairs = rest
+        return vector
+
+    async def get_rate_vector(self) -> Dict[str, Decimal]:
+        """ Последние курсы к опорной валюте из кэша. Кэш действителен, пока в БД не появились курсы
+            с более поздним временем загрузки, иначе курсы загружаются из БД заново
+        """
+        loaded_at = await self._get_loaded_at()
+        cached = await rate_cache.get(self.cache_key)
+        if cached is not None and cached[0] == loaded_at:
+            return cached[1]
+        vector = self._rate_vector(await self._get_latest_rates())
+        await rate_cache.set(self.cache_key, (loaded_at, vector), EXCHANGE_RATE_TTL)
+        return vector
+
+    async def get_rates(self, currency: str) -> Dict[str, Decimal]:
+        """ Курсы пересчета в валюту: на сколько умножить сумму в каждой валюте
+        :param currency: Код валюты, в которую пересчитываются суммы
+        """
+        vector = await self.get_rate_vector()
+        if currency not in vector:
+            return {currency: Decimal(1)}
+        target = vector[currency]
+        return {name: target / rate for name, rate in vector.items()}
+
+    @staticmethod
+    def convert(amount, currency_name, currency: str, rates: Dict[str, Decimal]) -> tuple:
+        """ Колонки currency и amount с суммой, пересчитанной в валюту в SQL запросе.
+            Суммы в валютах без курса остаются в своей валюте
+        :param amount: Колонка суммы
+        :param currency_name: Колонка названия валюты суммы
+        :param currency: Код валюты, в которую пересчитываются суммы
+        :param rates: Курсы пересчета из get_rates
+        """
+        rate = case(rates, value=func.upper(currency_name))
+        return (
+            case((rate.is_not(None), currency), else_=currency_name).label("currency"),
+            (amount * func.coalesce(rate, 1)).label("amount")
+        )
+
+
+class ExportEntity(Base):
+    """Выгрузка истории доходов и расходов """
+    EXPORT_BATCH_SIZE = 1000
+
+    @staticmethod
+    def _export_query(obj, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None]):
+        """ Плоские строки доходов / расходов без построения ORM объектов
+        :param obj: Модель расхода / дохода
+        :return: SQL запрос
+        """
+        query = select(
+            literal_column(f"'{obj.__tablename__}'").label("kind"),
+            obj.id,
+            obj.date,
+            obj.title,
+            obj.amount,
+            obj.category_id,
+            Category.name.label("category"),
+            obj.account_id,
+            Account.name.label("account"),
+            Currency.name.label("currency")
+        ).\
+            outerjoin(Category, Category.id == obj.category_id).\
+            outerjoin(Account, Account.id == obj.account_id).\
+            outerjoin(Currency, Currency.id == Account.currency_id).\
+            filter(obj.user_id == user_id)
+        if start_date:
+            query = query.filter(obj.date >= start_date)
+        if end_date:
+            query = query.filter(obj.date <= end_date)
+        return query.order_by(obj.date, obj.id)
+
+    async def stream_transactions(
+            self, user_id: int, start_date: Union[datetime, None], end_date: Union[datetime, None]
+    ) -> AsyncIterator[dict]:
+        """ Доходы, затем расходы пользователя через серверный курсор, по мере получения из БД
+        :param user_id: Текущий пользователь
+        :param start_date: Начальная дата
+        :param end_date: Конечная дата
+        """
+        for obj in (Income, Expense):
+            query = self._export_query(obj, user_id, start_date, end_date).\
+                execution_options(yield_per=self.EXPORT_BATCH_SIZE)
+            result = await self.session.stream(query)
+            async for row in result:
+                yield row._asdict()
@@ -0,0 +1,39 @@
+import json
+
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _default(value):
+    """ Типы, которые не сериализуются напрямую, в том же виде, что и у jsonable_encoder
+    """
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Enum):
+        return value.value
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """ Сериализация в JSON через orjson, если он установлен
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """ Ответ без повторной валидации через response_model и jsonable_encoder.
+        Содержимое должно быть уже подготовлено в структуре схемы ответа
+    """
+    def render(self, content) -> bytes:
+        return dumps(content)
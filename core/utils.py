@@ -1,5 +1,58 @@
+from datetime import datetime
+from sqlalchemy import DateTime, literal_column
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import GenericFunction
 from starlette.requests import Request
 
 
 def get_db(request: Request):
     return request.state.db
+
+
+class date_trunc(GenericFunction):
+    """ Усечение даты до начала периода (day, week, month)
+    """
+    name = "date_trunc"
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(date_trunc, "sqlite")
+def _date_trunc_sqlite(element, compiler, **kw):
+    period, column = element.clauses.clauses
+    modifiers = {
+        "day": "'%Y-%m-%d 00:00:00.000000', {}",
+        "week": "'%Y-%m-%d 00:00:00.000000', {}, 'weekday 0', '-6 days'",
+        "month": "'%Y-%m-01 00:00:00.000000', {}",
+    }
+    return "strftime(%s)" % modifiers[period.name.strip("'")].format(compiler.process(column, **kw))
+
+
+def truncate_date(period: str, column):
+    """ Период передается литералом, чтобы выражение в SELECT и GROUP BY совпадало
+    :param period: day, week или month
+    :param column: Колонка с датой
+    """
+    return date_trunc(literal_column(f"'{period}'"), column)
+
+
+def month_start(date: datetime) -> datetime:
+    """ Начало месяца для даты
+    """
+    return date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def escape_like(text: str) -> str:
+    """ Экранирование спецсимволов LIKE в строке поиска, экранирующий символ - обратный слэш
+    """
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def get_insert(session):
+    """ insert с поддержкой ON CONFLICT для диалекта текущей сессии
+    """
+    if session.bind.dialect.name == "sqlite":
+        return sqlite_insert
+    return postgresql_insert
@@ -1,7 +1,12 @@
-from config import logger
+import logging
+import time
+
+from config import DB_REPLICA_STICKY, logger
+from core.engine import READ_PRIMARY_COOKIE, QueryStats, query_stats, replica_engine
+from core.metrics import registry
 from fastapi import FastAPI
 from starlette.requests import Request
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse
 from routes import routes
 
 import uvicorn
@@ -12,20 +17,80 @@ app = FastAPI()
 app.include_router(routes)
 logger.debug("Start application")
 
+request_duration = registry.histogram("http_request_duration_seconds", "HTTP request latency by route")
+request_db_queries = registry.histogram(
+    "http_request_db_queries", "SQL statements executed per HTTP request by route",
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 250)
+)
+request_db_duration = registry.histogram("http_request_db_seconds", "Time spent in SQL per HTTP request by route")
+
+_route_paths = {}
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def get_route_path(request: Request) -> str:
+    """ Шаблон пути маршрута (/finance/income/{id}), чтобы метки метрик не зависели от параметров
+    """
+    endpoint = request.scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    if not _route_paths:
+        _route_paths.update({route.endpoint: route.path for route in request.app.routes if hasattr(route, "endpoint")})
+    return _route_paths.get(endpoint, "unmatched")
+
+
+@app.middleware("http")
+async def read_primary_middleware(request: Request, call_next):
+    """ После успешного изменения данных чтения пользователя на DB_REPLICA_STICKY секунд
+        идут на основную БД, пока реплика не догонит ее
+    """
+    response = await call_next(request)
+    if replica_engine is not None and request.method not in SAFE_METHODS and response.status_code < 400:
+        response.set_cookie(READ_PRIMARY_COOKIE, "1", max_age=DB_REPLICA_STICKY, httponly=True, samesite="lax")
+    return response
+
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    stats = QueryStats()
+    token = query_stats.set(stats)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        query_stats.reset(token)
+        labels = {"method": request.method, "route": get_route_path(request), "status": status_code}
+        request_duration.observe(time.perf_counter() - start, **labels)
+        request_db_queries.observe(stats.count, **labels)
+        request_db_duration.observe(stats.duration, **labels)
+
 
 @app.middleware("http")
 async def exception_middleware(request: Request, call_next):
     try:
         response = await call_next(request)
-        logger.debug(
-            f"{request.scope['client'][0]}:{request.scope['client'][1]} - '{request.method} {request.scope['path']} "
-            f"{request.scope['scheme']}/{request.scope['http_version']} {response.status_code}'"
-        )
+        if logger.isEnabledFor(logging.DEBUG):
+            client = request.scope.get("client") or ("-", "-")
+            logger.debug(
+                "%s:%s - '%s %s %s/%s %s'",
+                client[0], client[1], request.method, request.scope["path"],
+                request.scope["scheme"], request.scope["http_version"], response.status_code
+            )
         return response
     except Exception as e:
         logger.error(str(e))
         return JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
 
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """ Prometheus metrics endpoint
+    """
+    return PlainTextResponse(registry.render())
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8001, log_level="info")
@@ -0,0 +1,35 @@
+"""Added user indexes
+
+Revision ID: 3c1f9a7d2e64
+Revises: 84ca3b503483
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f9a7d2e64'
+down_revision = '84ca3b503483'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_income_user_id_date_id', 'income', ['user_id', 'date', 'id'], unique=False)
+    op.create_index('ix_income_user_id_category_id_date', 'income', ['user_id', 'category_id', 'date'], unique=False)
+    op.create_index('ix_expense_user_id_date_id', 'expense', ['user_id', 'date', 'id'], unique=False)
+    op.create_index('ix_expense_user_id_category_id_date', 'expense', ['user_id', 'category_id', 'date'], unique=False)
+    op.create_index('ix_account_user_id', 'account', ['user_id'], unique=False)
+    op.create_index('ix_category_user_id', 'category', ['user_id'], unique=False)
+    op.create_index('ix_currency_user_id', 'currency', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_currency_user_id', table_name='currency')
+    op.drop_index('ix_category_user_id', table_name='category')
+    op.drop_index('ix_account_user_id', table_name='account')
+    op.drop_index('ix_expense_user_id_category_id_date', table_name='expense')
+    op.drop_index('ix_expense_user_id_date_id', table_name='expense')
+    op.drop_index('ix_income_user_id_category_id_date', table_name='income')
+    op.drop_index('ix_income_user_id_date_id', table_name='income')
@@ -0,0 +1,52 @@
+"""Added sync columns
+
+Revision ID: 5d8b0f2a6c31
+Revises: e7a3c5f19d20
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8b0f2a6c31'
+down_revision = 'e7a3c5f19d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table_name in ('income', 'expense', 'category', 'currency'):
+        op.add_column(table_name, sa.Column('updated_at', sa.DateTime(), nullable=True))
+    # Существующие записи получают отметку времени миграции
+    for table_name in ('income', 'expense', 'category', 'currency', 'account'):
+        table = sa.table(table_name, sa.column('updated_at', sa.DateTime()))
+        op.execute(table.update().where(table.c.updated_at.is_(None)).values(updated_at=sa.func.now()))
+    op.create_index('ix_income_user_id_updated_at', 'income', ['user_id', 'updated_at'], unique=False)
+    op.create_index('ix_expense_user_id_updated_at', 'expense', ['user_id', 'updated_at'], unique=False)
+    op.create_index('ix_account_user_id_updated_at', 'account', ['user_id', 'updated_at'], unique=False)
+    op.create_index('ix_category_user_id_updated_at', 'category', ['user_id', 'updated_at'], unique=False)
+    op.create_index('ix_currency_user_id_updated_at', 'currency', ['user_id', 'updated_at'], unique=False)
+    op.create_table('tombstone',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('entity', sa.String(), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tombstone_user_id_deleted_at', 'tombstone', ['user_id', 'deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tombstone_user_id_deleted_at', table_name='tombstone')
+    op.drop_table('tombstone')
+    op.drop_index('ix_currency_user_id_updated_at', table_name='currency')
+    op.drop_index('ix_category_user_id_updated_at', table_name='category')
+    op.drop_index('ix_account_user_id_updated_at', table_name='account')
+    op.drop_index('ix_expense_user_id_updated_at', table_name='expense')
+    op.drop_index('ix_income_user_id_updated_at', table_name='income')
+    for table_name in ('currency', 'category', 'expense', 'income'):
+        op.drop_column(table_name, 'updated_at')
@@ -0,0 +1,34 @@
+"""Added monthly rollup
+
+Revision ID: 9b2e4d61c8a5
+Revises: 3c1f9a7d2e64
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b2e4d61c8a5'
+down_revision = '3c1f9a7d2e64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('monthly_rollup',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.DateTime(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'month', 'category_id', 'account_id', 'kind')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('monthly_rollup')
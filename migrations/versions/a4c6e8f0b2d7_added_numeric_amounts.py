@@ -0,0 +1,49 @@
+"""Added numeric amounts
+
+Revision ID: a4c6e8f0b2d7
+Revises: 5d8b0f2a6c31
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c6e8f0b2d7'
+down_revision = '5d8b0f2a6c31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    for table_name in ('account', 'income', 'expense'):
+        op.alter_column(table_name, 'amount',
+                        existing_type=sa.Float(),
+                        type_=sa.Numeric(18, 2),
+                        postgresql_using='round(amount::numeric, 2)')
+    op.alter_column('monthly_rollup', 'total',
+                    existing_type=sa.Float(),
+                    type_=sa.Numeric(18, 2),
+                    existing_nullable=False,
+                    postgresql_using='round(total::numeric, 2)')
+    # Итоги, накопленные во float, пересчитываются по точным суммам
+    op.execute("DELETE FROM monthly_rollup")
+    for table_name in ('income', 'expense'):
+        op.execute(
+            "INSERT INTO monthly_rollup (user_id, month, category_id, account_id, kind, total, count) "
+            f"SELECT user_id, date_trunc('month', date), coalesce(category_id, 0), coalesce(account_id, 0), "
+            f"'{table_name}', sum(amount), count(*) FROM {table_name} WHERE user_id IS NOT NULL "
+            "GROUP BY user_id, date_trunc('month', date), coalesce(category_id, 0), coalesce(account_id, 0)"
+        )
+
+
+def downgrade() -> None:
+    op.alter_column('monthly_rollup', 'total',
+                    existing_type=sa.Numeric(18, 2),
+                    type_=sa.Float(),
+                    existing_nullable=False)
+    for table_name in ('expense', 'income', 'account'):
+        op.alter_column(table_name, 'amount',
+                        existing_type=sa.Numeric(18, 2),
+                        type_=sa.Float())
@@ -0,0 +1,110 @@
+"""Partitioned income and expense by date
+
+Revision ID: b9e2c4a7d613
+Revises: f3b7a1d5c9e8
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+from datetime import datetime
+import sqlalchemy as sa
+
+from config import PARTITION_AHEAD, PARTITION_INTERVAL
+from core.partitions import (
+    PARTITIONED_TABLES, create_partition_statements, default_partition_statement, next_period, period_start,
+    shift_periods
+)
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e2c4a7d613'
+down_revision = 'f3b7a1d5c9e8'
+branch_labels = None
+depends_on = None
+
+COLUMNS = "id, title, category_id, amount, account_id, date, user_id, updated_at"
+INDEXES = (
+    ('user_id_date_id', ['user_id', 'date', 'id']),
+    ('user_id_category_id_date', ['user_id', 'category_id', 'date']),
+    ('user_id_updated_at', ['user_id', 'updated_at']),
+)
+
+
+def create_table(table_name: str, primary_key: list, **kw):
+    op.create_table(table_name,
+    sa.Column('id', sa.Integer(), server_default=sa.text(f"nextval('{table_name}_id_seq'::regclass)"),
+              nullable=False),
+    sa.Column('title', sa.String(), nullable=True),
+    sa.Column('category_id', sa.Integer(), nullable=True),
+    sa.Column('amount', sa.Numeric(18, 2), nullable=True),
+    sa.Column('account_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.DateTime(), nullable='date' not in primary_key),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['account_id'], ['account.id'], ),
+    sa.ForeignKeyConstraint(['category_id'], ['category.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint(*primary_key),
+    **kw
+    )
+
+
+def create_indexes(table_name: str, unique_id: bool):
+    op.create_index(f'ix_{table_name}_id', table_name, ['id'], unique=unique_id)
+    for name, columns in INDEXES:
+        op.create_index(f'ix_{table_name}_{name}', table_name, columns, unique=False)
+    op.create_index(f'ix_{table_name}_title_trgm', table_name, ['title'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'})
+
+
+def drop_indexes(table_name: str, indexed_table_name: str):
+    op.drop_index(f'ix_{table_name}_id', table_name=indexed_table_name)
+    for name, _ in INDEXES:
+        op.drop_index(f'ix_{table_name}_{name}', table_name=indexed_table_name)
+    op.drop_index(f'ix_{table_name}_title_trgm', table_name=indexed_table_name)
+
+
+def rename_table(table_name: str, old_table_name: str):
+    """ Старая таблица переименовывается без индексов, последовательность id переходит к новой таблице
+    """
+    op.rename_table(table_name, old_table_name)
+    op.execute(f"ALTER TABLE {old_table_name} RENAME CONSTRAINT {table_name}_pkey TO {old_table_name}_pkey")
+    drop_indexes(table_name, old_table_name)
+    op.execute(f"ALTER SEQUENCE {table_name}_id_seq OWNED BY NONE")
+
+
+def move_rows(table_name: str, old_table_name: str, date_column: str):
+    op.execute(
+        f"INSERT INTO {table_name} ({COLUMNS}) SELECT id, title, category_id, amount, account_id, "
+        f"{date_column}, user_id, updated_at FROM {old_table_name}"
+    )
+    op.drop_table(old_table_name)
+    op.execute(f"ALTER SEQUENCE {table_name}_id_seq OWNED BY {table_name}.id")
+
+
+def upgrade() -> None:
+    # Ключ секционирования должен входить в первичный ключ, поэтому он становится (id, date)
+    for table_name in PARTITIONED_TABLES:
+        old_table_name = f"{table_name}_unpartitioned"
+        rename_table(table_name, old_table_name)
+        create_table(table_name, ['id', 'date'], postgresql_partition_by='RANGE (date)')
+        op.execute(default_partition_statement(table_name))
+        first_date = op.get_bind().execute(sa.text(f"SELECT min(date) FROM {old_table_name}")).scalar()
+        start = period_start(first_date or datetime.utcnow(), PARTITION_INTERVAL)
+        end = shift_periods(datetime.utcnow(), PARTITION_INTERVAL, PARTITION_AHEAD)
+        while start <= end:
+            for statement in create_partition_statements(table_name, start, PARTITION_INTERVAL):
+                op.execute(statement)
+            start = next_period(start, PARTITION_INTERVAL)
+        move_rows(table_name, old_table_name, "coalesce(date, updated_at, now())")
+        create_indexes(table_name, unique_id=False)
+
+
+def downgrade() -> None:
+    # Секции удаляются вместе с таблицей, отсоединенные в архив секции не возвращаются
+    for table_name in PARTITIONED_TABLES:
+        old_table_name = f"{table_name}_partitioned"
+        rename_table(table_name, old_table_name)
+        create_table(table_name, ['id'])
+        move_rows(table_name, old_table_name, "date")
+        create_indexes(table_name, unique_id=True)
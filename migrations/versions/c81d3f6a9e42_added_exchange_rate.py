@@ -0,0 +1,33 @@
+"""Added exchange rate
+
+Revision ID: c81d3f6a9e42
+Revises: a4c6e8f0b2d7
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81d3f6a9e42'
+down_revision = 'a4c6e8f0b2d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('exchange_rate',
+    sa.Column('base', sa.String(), nullable=False),
+    sa.Column('quote', sa.String(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('rate', sa.Numeric(precision=18, scale=8), nullable=False),
+    sa.Column('loaded_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('base', 'quote', 'date')
+    )
+    op.create_index('ix_exchange_rate_loaded_at', 'exchange_rate', ['loaded_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_exchange_rate_loaded_at', table_name='exchange_rate')
+    op.drop_table('exchange_rate')
@@ -0,0 +1,27 @@
+"""Added title search indexes
+
+Revision ID: f3b7a1d5c9e8
+Revises: c81d3f6a9e42
+Create Date: 2026-10-18 21:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b7a1d5c9e8'
+down_revision = 'c81d3f6a9e42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table_name in ('income', 'expense'):
+        op.create_index(f'ix_{table_name}_title_trgm', table_name, ['title'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    for table_name in ('expense', 'income'):
+        op.drop_index(f'ix_{table_name}_title_trgm', table_name=table_name)
@@ -1,12 +1,133 @@
-from config import SECRET
+import time
+import uuid
+
+import jwt
+
+from config import SECRET, AUTH_STATELESS, USER_CACHE_TTL
+from core.cache import MemoryBackend
 from fastapi_users.authentication import AuthenticationBackend, CookieTransport, JWTStrategy
+from fastapi_users.jwt import decode_jwt, generate_jwt
+from typing import Optional, Union
+from users.schemas import UserClaims
+
+
+TOKEN_LIFETIME = 3600
+
+cookie_transport = CookieTransport(cookie_max_age=TOKEN_LIFETIME)
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class RevocationList:
+    """ Отозванные токены и пользователи в памяти процесса.
+        Записи хранятся не дольше времени жизни токена
+    """
+    def __init__(self):
+        self._tokens = {}
+        self._users = {}
+
+    def _prune(self):
+        now = time.time()
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+        self._users = {
+            user_id: revoked_at for user_id, revoked_at in self._users.items()
+            if revoked_at / 1000 + TOKEN_LIFETIME > now
+        }
+
+    def revoke_token(self, jti: str, exp: float):
+        self._prune()
+        self._tokens[jti] = exp
+
+    def revoke_user(self, user_id: int):
+        """ Отзыв всех выданных пользователю токенов (деактивация, смена пароля)
+        """
+        self._prune()
+        self._users[user_id] = now_ms()
+
+    def is_revoked(self, data: dict) -> bool:
+        if data.get("jti") in self._tokens:
+            return True
+        revoked_at = self._users.get(int(data["sub"]))
+        if revoked_at is None:
+            return False
+        issued_at = data.get("iat_ms", data.get("iat", 0) * 1000)
+        return issued_at <= revoked_at
+
+
+revocation_list = RevocationList()
+user_cache = MemoryBackend()
+
+
+class ClaimsJWTStrategy(JWTStrategy):
+    """ JWT, в котором хранятся нужные для авторизации поля пользователя.
+        Такой токен не требует запроса пользователя из БД на каждый запрос
+    """
+    async def write_token(self, user) -> str:
+        data = {
+            "sub": str(user.id),
+            "aud": self.token_audience,
+            "jti": uuid.uuid4().hex,
+            "iat": int(time.time()),
+            # Время выдачи в мс для сравнения с отзывом: iat в секундах не отличает токен,
+            # выданный сразу после отзыва в ту же секунду
+            "iat_ms": now_ms(),
+            "is_active": user.is_active,
+            "is_verified": user.is_verified,
+            "is_superuser": user.is_superuser,
+        }
+        return generate_jwt(data, self.encode_key, self.lifetime_seconds, algorithm=self.algorithm)
+
+    async def destroy_token(self, token: str, user) -> None:
+        data = self._decode(token)
+        if data:
+            revocation_list.revoke_token(data.get("jti"), data.get("exp", time.time() + TOKEN_LIFETIME))
+
+    def _decode(self, token: Optional[str]) -> Union[dict, None]:
+        if token is None:
+            return None
+        try:
+            data = decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+        except jwt.PyJWTError:
+            return None
+        if data.get("sub") is None or revocation_list.is_revoked(data):
+            return None
+        return data
 
+    async def read_token(self, token: Optional[str], user_manager):
+        if self._decode(token) is None:
+            return None
+        return await super().read_token(token, user_manager)
 
-cookie_transport = CookieTransport(cookie_max_age=3600)
+    async def read_claims(self, token: Optional[str], user_manager) -> Union[UserClaims, None]:
+        """ Пользователь из полей токена. Для токенов без этих полей пользователь
+            загружается из БД и кэшируется на USER_CACHE_TTL секунд
+        """
+        data = self._decode(token)
+        if data is None:
+            return None
+        if "is_active" in data:
+            return UserClaims(
+                id=data["sub"],
+                is_active=data["is_active"],
+                is_verified=data["is_verified"],
+                is_superuser=data.get("is_superuser", False)
+            )
+        claims = await user_cache.get(data["sub"])
+        if claims is None:
+            user = await super().read_token(token, user_manager)
+            if user is None:
+                return None
+            claims = UserClaims.from_orm(user)
+            await user_cache.set(data["sub"], claims, USER_CACHE_TTL)
+        return claims
 
 
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
+    if AUTH_STATELESS:
+        return ClaimsJWTStrategy(secret=SECRET, lifetime_seconds=TOKEN_LIFETIME)
+    return JWTStrategy(secret=SECRET, lifetime_seconds=TOKEN_LIFETIME)
 
 
 auth_backend = AuthenticationBackend(
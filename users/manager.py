@@ -3,9 +3,13 @@ from typing import Optional
 from fastapi import Depends, Request
 from fastapi_mail import FastMail, MessageType, MessageSchema, ConnectionConfig
 from fastapi_users import BaseUserManager, IntegerIDMixin
+from .auth import revocation_list
 from .models import User, get_user_db
 
 
+# Изменение этих полей отзывает выданные пользователю токены
+REVOKING_FIELDS = {"password", "is_active", "is_verified", "is_superuser"}
+
 # conf = ConnectionConfig(
 #     MAIL_USERNAME=MAIL_USERNAME,
 #     MAIL_PASSWORD=MAIL_PASSWORD,
@@ -56,6 +60,14 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
         # TODO Fixed send mail on_after_request_verify WHAT IS FUCK?
         print(f"Verification requested for user {user.id}. Verification token: {token}")
 
+    async def on_after_update(self, user: User, update_dict: dict, request: Optional[Request] = None):
+        # Пароль и поля пользователя, которые хранятся в JWT, меняют доступ, поэтому ранее выданные токены отзываются
+        if REVOKING_FIELDS.intersection(update_dict):
+            revocation_list.revoke_user(user.id)
+
+    async def on_after_reset_password(self, user: User, request: Optional[Request] = None):
+        revocation_list.revoke_user(user.id)
+
 
 async def get_user_manager(user_db=Depends(get_user_db)):
     yield UserManager(user_db)
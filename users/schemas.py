@@ -1,4 +1,5 @@
 from fastapi_users import schemas
+from pydantic import BaseModel
 
 
 class UserRead(schemas.BaseUser[int]):
@@ -11,3 +12,15 @@ class UserCreate(schemas.BaseUserCreate):
 
 class UserUpdate(schemas.BaseUserUpdate):
     pass
+
+
+class UserClaims(BaseModel):
+    """ Пользователь, восстановленный из полей JWT без запроса в БД
+    """
+    id: int
+    is_active: bool = True
+    is_verified: bool = False
+    is_superuser: bool = False
+
+    class Config:
+        orm_mode = True
@@ -1,7 +1,10 @@
+from config import AUTH_STATELESS
+from fastapi import Depends, HTTPException, status
 from fastapi_users import FastAPIUsers, fastapi_users
-from users.auth import auth_backend
+from users.auth import auth_backend, cookie_transport
 from users.models import User
 from users.manager import get_user_manager
+from users.schemas import UserClaims
 
 
 fastapi_users = FastAPIUsers[User, int](
@@ -9,4 +12,24 @@ fastapi_users = FastAPIUsers[User, int](
     [auth_backend],
 )
 
-current_user = fastapi_users.current_user()
+
+def get_current_user(active: bool = False, verified: bool = False, superuser: bool = False):
+    """ Зависимость для получения пользователя из полей JWT без запроса в БД.
+        Коды ответов совпадают с fastapi_users.current_user
+    """
+    async def current_user_dependency(
+            token: str = Depends(cookie_transport.scheme),
+            user_manager=Depends(get_user_manager),
+            strategy=Depends(auth_backend.get_strategy)
+    ) -> UserClaims:
+        user = await strategy.read_claims(token, user_manager)
+        if user is None or (active and not user.is_active):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        if (verified and not user.is_verified) or (superuser and not user.is_superuser):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+        return user
+
+    return current_user_dependency
+
+
+current_user = get_current_user() if AUTH_STATELESS else fastapi_users.current_user()